@@ -2,11 +2,16 @@
 """
 Simple script to create new blog posts for CassidyBlog
 Usage: python add_post.py
+       python add_post.py --compile-all   # (re)compile stored HTML for every post
+       python add_post.py --compile-all --jobs 4   # ...rendering in 4 processes
 """
 
 import os
+import sys
 from datetime import datetime
 
+from post_store import atomic_write
+
 def create_slug(title):
     """Convert title to URL-friendly slug"""
     slug = title.lower()
@@ -24,7 +29,36 @@ def create_slug(title):
     slug = slug.strip('-')
     return slug
 
+def compile_new_post(filepath):
+    """Render and sanitize a freshly written post once, at publish time"""
+    try:
+        from app import compile_post
+        compile_post(filepath)
+        print("⚙️  Rendered HTML compiled and stored")
+    except Exception as e:
+        print(f"⚠️  Could not pre-compile the post ({e}); it will be compiled on first view.")
+
+def compile_all_posts(workers=None):
+    """Bulk compile: bring the stored HTML up to date with every post"""
+    from app import compile_all
+    print("=== CassidyBlog Compile ===\n")
+    summary = compile_all(workers=workers)
+    print(f"✅ {summary['posts']} posts checked, {summary['compiled']} compiled, "
+          f"{summary['errors']} failed, {summary['pruned']} orphaned entries removed")
+
 def main():
+    args = sys.argv[1:]
+    if '--compile-all' in args:
+        workers = None
+        if '--jobs' in args:
+            try:
+                workers = int(args[args.index('--jobs') + 1])
+            except (IndexError, ValueError):
+                print("❌ --jobs needs a number of processes")
+                return
+        compile_all_posts(workers)
+        return
+
     # Get posts directory
     posts_dir = os.path.join(os.path.dirname(__file__), 'content', 'posts')
     
@@ -77,16 +111,18 @@ def main():
 {content}
 """
     
-    # Write to file
+    # Write to file (atomically, so the running site never sees a partial post)
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(full_content)
+        atomic_write(filepath, full_content)
         print(f"\n✅ Successfully created: {filepath}")
         print(f"📝 Article title: {title}")
         print(f"🔗 URL slug: {slug}")
-        print(f"\nYour post is ready! Restart your Flask app to see it live.")
     except Exception as e:
         print(f"\n❌ Error creating post: {e}")
+        return
+
+    compile_new_post(filepath)
+    print(f"\nYour post is ready! It will appear on the running site within a few seconds.")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,32 @@
-from flask import Flask, render_template, request, redirect, url_for, Response
-import markdown
+from flask import Flask, render_template, request, redirect, url_for, Response, make_response
 import os
 import secrets
-from datetime import datetime
+from datetime import datetime, timezone
 import glob
 import re
-from functools import lru_cache, wraps
+import hashlib
+import threading
+import time
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+from itertools import repeat
 from flask_talisman import Talisman
 from flask_wtf.csrf import CSRFProtect
-import bleach
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
+from compression import init_compression, etag_variants, compressed_responses
+from search import SearchIndex, tokenize, snippet
+from related import RelatedIndex
+from post_content import (
+    PostMeta, RENDERER_FINGERPRINT, build_post, markdown_to_html, parse_post_content, sanitize_html,
+)
+from metrics import metrics
+from post_store import PostStore, atomic_write, file_lock
+from mail_queue import mail_queue_from_env
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
@@ -45,31 +63,21 @@ Talisman(
 # CSRF protection
 csrf = CSRFProtect(app)
 
-# Bleach allowlist for sanitizing rendered markdown
-ALLOWED_TAGS = [
-    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-    'p', 'br', 'hr',
-    'strong', 'em', 'b', 'i', 'u', 's', 'del',
-    'pre', 'code',
-    'ul', 'ol', 'li',
-    'blockquote',
-    'a',
-    'table', 'thead', 'tbody', 'tr', 'th', 'td',
-    'img',
-    'sup', 'sub',
-    'div', 'span',
-]
-
-ALLOWED_ATTRIBUTES = {
-    'a': ['href', 'title', 'rel'],
-    'img': ['src', 'alt', 'title'],
-    'code': ['class'],
-    'pre': ['class'],
-    'div': ['class'],
-    'span': ['class'],
-    'td': ['align'],
-    'th': ['align'],
-}
+# Behind a reverse proxy (Railway), take the client address from this many
+# X-Forwarded-For hops so rate limits apply per visitor rather than per proxy.
+# Railway sets RAILWAY_ENVIRONMENT and puts exactly one proxy in front of us
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 1 if 'RAILWAY_ENVIRONMENT' in os.environ else 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Per-IP rate limits. memory:// counts per worker process; point
+# RATELIMIT_STORAGE_URI at Redis or Memcached to share the counts
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://'),
+)
+CONTACT_RATE_LIMIT = os.environ.get('CONTACT_RATE_LIMIT', '5 per minute;20 per day')
 
 # HTTP Basic Auth for protected routes
 def check_auth(username, password):
@@ -97,174 +105,868 @@ def set_extra_security_headers(response):
     response.headers['X-XSS-Protection'] = '1; mode=block'
     return response
 
+# Per-stage timings (Server-Timing header, /metrics); registered before compression
+# so the recorded request time includes it
+metrics.init_app(app)
+
+# Gzip/brotli for rendered pages, versioned and precompressed static files
+init_compression(app)
+
+# Conditional GET: content routes send an ETag and Last-Modified and answer a
+# matching If-None-Match / If-Modified-Since with 304 before rendering anything
+def _build_fingerprint():
+    """Hash of app.py, the post renderer, the templates and the static file versions,
+    so validators change on every deploy and whenever a page's asset URLs do"""
+    digest = hashlib.sha256()
+    latest = 0
+    files = [os.path.abspath(__file__), os.path.join(app.root_path, 'post_content.py')]
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    files += [os.path.join(template_dir, name) for name in sorted(os.listdir(template_dir))]
+    for file in files:
+        digest.update(os.path.basename(file).encode('utf-8'))
+        with open(file, 'rb') as f:
+            digest.update(f.read())
+        latest = max(latest, os.path.getmtime(file))
+    static_versions = app.extensions['static_versions']
+    for dirpath, dirnames, filenames in os.walk(app.static_folder):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith(('.gz', '.br')):
+                continue
+            rel = os.path.relpath(os.path.join(dirpath, name), app.static_folder).replace(os.sep, '/')
+            digest.update(static_versions.versioned_name(rel).encode('utf-8'))
+            latest = max(latest, os.path.getmtime(os.path.join(dirpath, name)))
+    return digest.hexdigest(), latest
+
+BUILD_FINGERPRINT, BUILD_MTIME = _build_fingerprint()
+
+def make_validators(version, mtime):
+    """Strong ETag and Last-Modified for content derived from version and mtime"""
+    etag = hashlib.sha256(f"{BUILD_FINGERPRINT}:{version}".encode('utf-8')).hexdigest()[:32]
+    last_modified = datetime.fromtimestamp(int(max(mtime, BUILD_MTIME)), timezone.utc)
+    return etag, last_modified
+
+def not_modified(etag, last_modified):
+    """Return a 304 response if the request's validators match, else None"""
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        if not any(request.if_none_match.contains_weak(tag) for tag in etag_variants(etag)):
+            return None
+    elif not request.if_modified_since or request.if_modified_since < last_modified:
+        return None
+    return add_validators(Response(status=304), etag, last_modified)
+
+def add_validators(response, etag, last_modified):
+    """Attach cache validators; clients may store the page but must revalidate"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
 # Blog posts directory
-POSTS_DIR = os.path.join(os.path.dirname(__file__), 'content', 'posts')
+POSTS_DIR = os.environ.get('POSTS_DIR', os.path.join(os.path.dirname(__file__), 'content', 'posts'))
 # Force redeploy to ensure new blog post appears
 
-@lru_cache(maxsize=32)
-def get_cached_posts():
-    """Cached version of get_posts for better performance"""
-    return _get_posts_internal()
+# How often (seconds) a request may stat the posts directory for new or removed
+# files, and how often every file is re-stat'ed to catch in-place edits
+REINDEX_INTERVAL = float(os.environ.get('REINDEX_INTERVAL', 2))
+REINDEX_FULL_INTERVAL = float(os.environ.get('REINDEX_FULL_INTERVAL', 60))
+
+# Listing sizes: articles per /blog page, and the recent slice shown on /
+POSTS_PER_PAGE = int(os.environ.get('POSTS_PER_PAGE', 20))
+RECENT_POSTS = int(os.environ.get('RECENT_POSTS', 10))
+
+# Cold-start builds (the first index scan, compile_all) parse and render posts in
+# this many processes: 0 means one per CPU, 1 keeps everything in this process.
+# Starting a pool and shipping results back costs ~0.5 s for 5000 posts (each
+# process imports post_content only), so it only pays off for batches at least
+# this big: parsing alone is ~0.07 ms a post, parsing plus markdown and bleach ~10 ms
+INDEX_BUILD_WORKERS = int(os.environ.get('INDEX_BUILD_WORKERS', 0))
+PARALLEL_PARSE_MIN_FILES = 10000
+PARALLEL_RENDER_MIN_FILES = 100
 
-def _get_posts_internal():
-    """Internal function to read and parse blog posts"""
-    posts = []
-    for file in glob.glob(os.path.join(POSTS_DIR, '*.md')):
+# Shared by every worker: compiled post HTML and the post index metadata
+BLOG_DB = os.environ.get('BLOG_DB', os.path.join(app.instance_path, 'blog.db'))
+post_store = PostStore(BLOG_DB)
+
+# Contact form messages are queued in the same database and sent by a
+# background thread (see mail_queue.py), never inside the request
+mail_queue = mail_queue_from_env(post_store)
+CONTACT_MAX_LENGTH = 5000
+EMAIL_RE = re.compile(r'^[^@\s<>(),;:"]+@[^@\s<>(),;:"]+\.[^@\s<>(),;:"]+$')
+
+def _load_post(file):
+    """Read and parse a single post file into a PostMeta, or None if it can't be read"""
+    _, entry, _, error = build_post(file)
+    if error:
+        print(f"Error reading {file}: {error}")
+    return entry
+
+def build_posts(files, render=False, workers=None, min_files=None):
+    """Parse (and optionally render) many post files, fanning out over a process pool.
+
+    Returns [(file, PostMeta, html, error)] sorted by file name, whatever order
+    the workers finish in. A file that fails is reported and skipped; it never
+    aborts the build.
+    """
+    files = sorted(files)
+    workers = INDEX_BUILD_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if min_files is None:
+        min_files = PARALLEL_RENDER_MIN_FILES if render else PARALLEL_PARSE_MIN_FILES
+    results = None
+    if workers > 1 and len(files) >= min_files:
         try:
-            with open(file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                post_data = parse_post_content(content, file)
-                if post_data:
-                    posts.append(post_data)
-        except Exception as e:
-            print(f"Error reading {file}: {e}")
-            continue
-    
-    # Sort by custom date first, then by filename as fallback
-    return sorted(posts, key=lambda x: (x['date_obj'], x['slug']), reverse=True)
-
-def parse_post_content(content, file_path):
-    """Parse markdown content and extract metadata"""
-    lines = content.split('\n')
-    if not lines:
+            # spawn, not fork: the caller may be a threaded server process
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                chunksize = max(1, len(files) // (workers * 8))
+                # Pool processes import post_content only, not this module
+                results = list(pool.map(build_post, files, repeat(render), chunksize=chunksize))
+        except (OSError, BrokenProcessPool) as e:
+            print(f"Parallel build failed ({e}); building serially")
+    if results is None:
+        results = [build_post(file, render) for file in files]
+    for file, _, _, error in results:
+        if error:
+            print(f"Error reading {file}: {error}")
+    return results
+
+class PostIndex:
+    """In-memory index of every post, keyed by slug.
+
+    Built once on first use and shared by the listing and article routes, so
+    resolving a slug is a dict lookup rather than a directory scan. Each entry
+    is a PostMeta holding the file path, its stat info and listing metadata;
+    post bodies are never kept in the index.
+
+    After the first build the index is kept fresh incrementally: refresh()
+    re-parses only files whose mtime or size changed and drops deleted ones,
+    and maybe_refresh() throttles that behind a cheap directory stat.
+
+    With a PostStore the metadata is shared between processes: the first one
+    to start parses the corpus into the store and the others load its rows.
+    Every change is written back and bumps the store's version, so a worker
+    picks up posts published by another one without re-parsing them.
+    """
+
+    def __init__(self, posts_dir, store=None):
+        self.posts_dir = posts_dir
+        self.store = store
+        self._store_version = 0
+        self._entries = None
+        self._sorted = None
+        self._sorted_digest = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._dir_mtime = None
+        self._last_check = 0.0
+        self._last_full = 0.0
+        self._changed_at = 0.0
+
+    def _built(self):
+        entries = self._entries
+        if entries is None:
+            from_store = False
+            with self._lock:
+                if self._entries is None:
+                    self._dir_mtime = self._stat_dir()
+                    self._last_check = self._last_full = time.monotonic()
+                    self._entries, from_store = self._load()
+                    self._sorted = None
+                entries = self._entries
+            if from_store:
+                # Stored rows may predate edits made while nothing was running
+                self.refresh()
+        return entries
+
+    def _load(self):
+        """Return ({slug: entry}, whether it came from the store's existing rows)"""
+        if self.store is not None:
+            loaded = self.store.load_or_build_posts(
+                self.posts_dir, lambda: [entry.row() for entry in self._scan().values()]
+            )
+            if loaded is not None:
+                version, rows, built = loaded
+                self._store_version = version
+                return {row[0]: PostMeta.from_row(row) for row in rows}, not built
+        return self._scan(), False
+
+    def _stat_dir(self):
+        try:
+            return os.stat(self.posts_dir).st_mtime
+        except OSError:
+            return None
+
+    def _scan(self):
+        entries = {}
+        for _, entry, _, _ in build_posts(glob.glob(os.path.join(self.posts_dir, '*.md'))):
+            if entry:
+                entries[entry.slug] = entry
+        return entries
+
+    def _post_files(self):
+        """Yield (path, stat) for every post file in the directory"""
+        try:
+            with os.scandir(self.posts_dir) as it:
+                for de in it:
+                    if de.name.startswith('.') or not de.name.endswith('.md'):
+                        continue
+                    try:
+                        if de.is_file():
+                            yield de.path, de.stat()
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Error scanning {self.posts_dir}: {e}")
+
+    def refresh(self):
+        """Re-index files whose mtime or size changed; returns the number of changes"""
+        entries = self._built()
+        with self._refresh_lock:
+            seen = set()
+            updates = []
+            for path, st in self._post_files():
+                slug = os.path.basename(path).replace('.md', '')
+                seen.add(slug)
+                entry = entries.get(slug)
+                if entry and entry.mtime == st.st_mtime and entry.size == st.st_size:
+                    continue
+                updates.append((slug, _load_post(path)))
+            removed = [slug for slug in entries if slug not in seen]
+
+            if not updates and not removed:
+                return 0
+            with self._lock:
+                for slug, entry in updates:
+                    if entry is None:
+                        entries.pop(slug, None)
+                    else:
+                        entries[slug] = entry
+                for slug in removed:
+                    entries.pop(slug, None)
+                self._sorted = None
+            if self.store is not None:
+                self.store.save_posts(
+                    self.posts_dir,
+                    upserts=[entry.row() for _, entry in updates if entry is not None],
+                    deletes=removed + [slug for slug, entry in updates if entry is None],
+                )
+            return len(updates) + len(removed)
+
+    def sync_store(self):
+        """Apply changes other processes wrote to the store; returns how many"""
+        if self.store is None:
+            return 0
+        entries = self._built()
+        version = self.store.posts_version(self.posts_dir)
+        if not version or version == self._store_version:
+            return 0
+        with self._refresh_lock:
+            loaded = self.store.load_posts(self.posts_dir, since=self._store_version)
+            if not loaded or not loaded[0]:
+                return 0
+            version, rows, slugs = loaded
+            with self._lock:
+                for row in rows:
+                    entries[row[0]] = PostMeta.from_row(row)
+                removed = [slug for slug in entries if slug not in slugs]
+                for slug in removed:
+                    del entries[slug]
+                self._sorted = None
+                self._store_version = version
+            return len(rows) + len(removed)
+
+    def maybe_refresh(self, interval=REINDEX_INTERVAL, full_interval=REINDEX_FULL_INTERVAL):
+        """Refresh if the directory changed, at most once per interval seconds.
+
+        Adding, removing or renaming a post changes the directory mtime; edits
+        in place don't, so every full_interval seconds all files are re-stat'ed.
+        Rows another worker already stored are loaded first, so a post it
+        published is picked up here without being parsed again.
+        """
+        self._built()
+        now = time.monotonic()
+        if now - self._last_check < interval:
+            return 0
+        self._last_check = now
+        changes = self.sync_store()
+        dir_mtime = self._stat_dir()
+        if dir_mtime == self._dir_mtime and now - self._last_full < full_interval:
+            return changes
+        self._dir_mtime = dir_mtime
+        self._last_full = now
+        return changes + self.refresh()
+
+    def get(self, slug):
+        """Return the index entry for slug, or None"""
+        return self._built().get(slug)
+
+    def add(self, file):
+        """Index (or re-index) a single post file; the explicit publish hook"""
+        entries = self._built()
+        entry = _load_post(file)
+        if entry is None:
+            return None
+        # refresh() walks entries under _refresh_lock alone, and a refresh that
+        # scanned the directory before this file existed would drop it again
+        with self._refresh_lock:
+            with self._lock:
+                entries[entry.slug] = entry
+                self._sorted = None
+            if self.store is not None:
+                self.store.save_posts(self.posts_dir, upserts=[entry.row()])
+        return entry
+
+    def _listing(self):
+        entries = self._built()
+        listing = self._sorted
+        if listing is None:
+            with self._lock:
+                # Sort by custom date first, then by filename as fallback
+                posts = sorted(
+                    entries.values(),
+                    key=lambda x: (x.date_obj, x.slug),
+                    reverse=True,
+                )
+                digest = hashlib.sha256()
+                for post in posts:
+                    digest.update(f"{post.slug}:{post.sha}\n".encode('utf-8'))
+                digest = digest.hexdigest()
+                if self._sorted_digest is not None and digest != self._sorted_digest:
+                    self._changed_at = time.time()
+                self._sorted_digest = digest
+                listing = self._sorted = (posts, digest, self._last_modified(posts))
+        return listing
+
+    def _last_modified(self, posts):
+        # A deleted or renamed post leaves no newer mtime behind, so the time
+        # the corpus last changed counts too (from the store, so every worker agrees)
+        changed_at = self.store.posts_changed_at(self.posts_dir) if self.store is not None else None
+        if changed_at is None:
+            changed_at = self._changed_at
+        return max(max((post.mtime for post in posts), default=0), changed_at)
+
+    def entries(self):
+        """Snapshot of the index as {slug: entry}"""
+        entries = self._built()
+        with self._lock:
+            return dict(entries)
+
+    def posts(self):
+        """All post metadata, newest first"""
+        return self._listing()[0]
+
+    def version(self):
+        """Corpus-level (digest, last modified); changes whenever any post does"""
+        _, digest, last_modified = self._listing()
+        return digest, last_modified
+
+post_index = PostIndex(POSTS_DIR, store=post_store)
+
+def refresh_posts():
+    """Pick up added, edited or removed post files without a restart"""
+    with metrics.stage('index'):
+        # Check the posts directory on every request in development/debug mode
+        if app.debug:
+            return post_index.maybe_refresh(interval=0, full_interval=0)
+        return post_index.maybe_refresh()
+
+def get_posts():
+    """Get all blog posts from the shared post index"""
+    refresh_posts()
+    return post_index.posts()
+
+def get_post_by_slug(slug):
+    """Find a specific post by its slug (filename without extension)"""
+    entry = post_index.get(slug)
+    if entry is None:
         return None
-    
-    # Extract title from first line
-    title = lines[0].replace('#', '').strip() if lines[0].startswith('#') else 'Untitled'
-    
-    # Get slug from filename
-    slug = os.path.basename(file_path).replace('.md', '')
-    
-    # Parse date from content or use predefined mapping
-    date_obj, date_str = extract_date_from_content(content, slug)
-    
-    # Create summary from content (skip title and potential date line)
-    summary = create_summary(lines)
-    
+    with metrics.stage('read'), open(entry.path, 'r', encoding='utf-8') as f:
+        content = f.read()
     return {
-        'title': title,
+        'title': entry.title,
         'content': content,
         'slug': slug,
-        'date_obj': date_obj,
-        'date_str': date_str,
-        'summary': summary,
-        'timestamp': os.path.getmtime(file_path)  # Keep for compatibility
+        'path': entry.path,
     }
 
-def extract_date_from_content(content, slug):
-    """Extract or assign publication date"""
-    # Manual date mapping for existing posts (newest first)
-    date_mapping = {
-        'nfl_sentiment_blog_post': ('2025-01-29', 'January 29, 2025'),  # Make this the newest
-        'healthcare_big_data_blog': ('2025-01-15', 'January 15, 2025'),
-        'insurance_data_mining_blog': ('2025-01-10', 'January 10, 2025'),
-        'banking_data_mining_blog': ('2025-01-05', 'January 5, 2025'),
-        'database_security_blog': ('2024-12-20', 'December 20, 2024'),
-        'dashboard_comparison_blog': ('2024-12-15', 'December 15, 2024'),
-        'doj_google_blog_post': ('2024-12-10', 'December 10, 2024'),
-    }
-    
-    if slug in date_mapping:
-        date_str, display_date = date_mapping[slug]
-        try:
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            return date_obj, display_date
-        except ValueError:
-            pass
-    
-    # Try to extract date from content using regex
-    date_pattern = r'\*([A-Za-z]+ \d{1,2}, \d{4})'
-    match = re.search(date_pattern, content)
-    if match:
+def render_post_html(content):
+    """Convert post markdown to sanitized HTML, timing the markdown and bleach stages"""
+    with metrics.stage('markdown'):
+        html_content = markdown_to_html(content)
+    with metrics.stage('bleach'):
+        return sanitize_html(html_content)
+
+# Publish-time compile: rendered, sanitized HTML is stored in the blog database
+# keyed by the source's SHA-256 and RENDERER_FINGERPRINT, so bleach runs once per
+# post version and again only if the sanitizing rules change
+def compiled_post_html(slug, content, sha):
+    """Stored HTML for this version of a post, compiling it only on a hash or renderer mismatch"""
+    with metrics.stage('store'):
+        html = post_store.get_compiled(slug, sha, RENDERER_FINGERPRINT)
+    if html is None:
+        html = render_post_html(content)
+        post_store.put_compiled(slug, sha, html, RENDERER_FINGERPRINT)
+    return html
+
+def compile_post(path):
+    """Index a post file and store its compiled HTML; returns its PostMeta or None"""
+    entry = post_index.add(path)
+    if entry is None:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    sha = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    compiled_post_html(entry.slug, content, sha)
+    return entry
+
+def compile_all(workers=None):
+    """Compile every post whose stored HTML is missing or stale, and drop orphans.
+
+    Stale posts are rendered by build_posts(), in parallel when there are
+    enough of them; workers overrides INDEX_BUILD_WORKERS. The search index
+    and related-posts table are brought up to date too.
+    """
+    post_index.refresh()
+    entries = post_index.entries()
+    stale = [entry.path for slug, entry in entries.items()
+             if post_store.get_compiled(slug, entry.sha, RENDERER_FINGERPRINT) is None]
+    compiled = 0
+    errors = 0
+    for _, entry, html, error in build_posts(stale, render=True, workers=workers):
+        if error:
+            errors += 1
+        elif entry is not None:
+            post_store.put_compiled(entry.slug, entry.sha, html, RENDERER_FINGERPRINT)
+            compiled += 1
+    pruned = post_store.prune_compiled(set(entries))
+    refresh_search(inline=True)
+    refresh_related(inline=True)
+    return {'posts': len(entries), 'compiled': compiled, 'errors': errors, 'pruned': pruned}
+
+class RenderedPostCache:
+    """Bounded LRU cache of rendered post HTML, validated against the source file.
+
+    Entries are keyed by file path and remember the mtime, size and SHA-256 of
+    the markdown they were rendered from. A matching mtime and size is a hit
+    without reading the file; otherwise the file is re-read and the content
+    hash decides whether the cached HTML can be reused.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        """Return the cached render for path, rendering it on a miss"""
         try:
-            date_str = match.group(1)
-            date_obj = datetime.strptime(date_str, '%B %d, %Y')
-            return date_obj, date_str
-        except ValueError:
-            pass
-    
-    # Fallback to file modification time
-    return datetime(2024, 1, 1), 'January 1, 2024'
-
-def create_summary(lines):
-    """Create a clean summary from content lines"""
-    # Skip title (line 0) and potential date/author line
-    start_idx = 1
-    if len(lines) > 1 and ('*' in lines[1] or lines[1].strip() == ''):
-        start_idx = 2
-    
-    # Find content lines (skip empty lines)
-    content_lines = []
-    for i in range(start_idx, min(len(lines), start_idx + 5)):
-        line = lines[i].strip()
-        if line and not line.startswith('#'):
-            content_lines.append(line)
-        if len(content_lines) >= 2:  # Get 2 substantial lines
-            break
-    
-    summary = ' '.join(content_lines)
-    # Clean up markdown formatting
-    summary = re.sub(r'[#*>]', '', summary)
-    summary = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', summary)  # Remove links
-    summary = summary.strip()
-    return summary[:200] + '...' if len(summary) > 200 else summary
+            st = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return None
 
-def get_posts():
-    """Get all blog posts with caching"""
-    # Clear cache in development/debug mode
-    if app.debug:
-        get_cached_posts.cache_clear()
-    return get_cached_posts()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
 
+        with metrics.stage('read'), open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        sha = hashlib.sha256(content.encode('utf-8')).hexdigest()
 
-def get_post_by_slug(slug):
-    """Find a specific post by its slug (filename without extension)"""
-    for file in glob.glob(os.path.join(POSTS_DIR, '*.md')):
-        if os.path.basename(file).replace('.md', '') == slug:
-            with open(file, 'r') as f:
-                content = f.read()
-                title = content.split('\n')[0].replace('#', '').strip()
-                return {
-                    'title': title,
-                    'content': content,
-                    'slug': slug
-                }
-    return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry['sha'] == sha:
+                # Touched but unchanged: keep the render, refresh the stat info
+                entry['mtime'] = st.st_mtime
+                entry['size'] = st.st_size
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        metadata = parse_post_content(content, path)
+        metadata.pop('content', None)
+        entry = {
+            'title': metadata['title'],
+            'slug': metadata['slug'],
+            'html': compiled_post_html(metadata['slug'], content, sha),
+            'metadata': metadata,
+            'mtime': st.st_mtime,
+            'size': st.st_size,
+            'sha': sha,
+        }
+
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, path=None):
+        """Drop one entry, or every entry when path is None"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self):
+        """Hit/miss/eviction counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+rendered_posts = RenderedPostCache(maxsize=int(os.environ.get('RENDER_CACHE_SIZE', 128)))
+metrics.register_cache('rendered_posts', rendered_posts.stats)
+metrics.register_cache('compressed_responses', compressed_responses.stats)
 
 @app.route('/')
 def index():
     posts = get_posts()
-    return render_template('index.html', posts=posts)
+    version, mtime = post_index.version()
+    etag, last_modified = make_validators(f"index:{version}", mtime)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    response = make_response(render_template(
+        'index.html',
+        posts=posts[:RECENT_POSTS],
+        more_posts=len(posts) > RECENT_POSTS,
+    ))
+    return add_validators(response, etag, last_modified)
 
 @app.route('/projects')
 def projects():
-    return render_template('projects.html')
+    etag, last_modified = make_validators('projects', 0)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    return add_validators(make_response(render_template('projects.html')), etag, last_modified)
 
-@app.route('/blog')
-def blog():
+@app.route('/blog', defaults={'page': 1})
+@app.route('/blog/page/<int:page>')
+def blog(page):
     posts = get_posts()
-    return render_template('blog.html', posts=posts)
+    pages = max(1, -(-len(posts) // POSTS_PER_PAGE))
+    if page < 1 or page > pages:
+        return "Page not found", 404
 
-@app.route('/blog/<slug>')
-def post(slug):
+    version, mtime = post_index.version()
+    etag, last_modified = make_validators(f"blog:{page}:{version}", mtime)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    offset = (page - 1) * POSTS_PER_PAGE
+    response = make_response(render_template(
+        'blog.html',
+        posts=posts[offset:offset + POSTS_PER_PAGE],
+        offset=offset,
+        page=page,
+        pages=pages,
+    ))
+    return add_validators(response, etag, last_modified)
+
+# Atom feed and sitemap: generated from the post index once per corpus version and
+# served from memory; compress_response keeps their compressed bodies by ETag.
+# SITE_URL fixes the absolute URLs (e.g. for freeze.py); otherwise the request's
+# host is used
+FEED_ENTRIES = int(os.environ.get('FEED_ENTRIES', 20))
+SITE_URL = os.environ.get('SITE_URL', '').rstrip('/')
+
+class GeneratedDocument:
+    """A generated response body, kept until its key (corpus version, site URL) changes"""
+
+    def __init__(self, render):
+        self.render = render
+        self._cached = None     # (key, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, *args):
+        """Return the body for key, calling render(*args) only if the key changed"""
+        cached = self._cached
+        if cached is None or cached[0] != key:
+            with self._lock:
+                cached = self._cached
+                if cached is None or cached[0] != key:
+                    self.misses += 1
+                    cached = self._cached = (key, self.render(*args))
+                    return cached[1]
+        self.hits += 1
+        return cached[1]
+
+    def stats(self):
+        """Hit/miss counters, in the same shape as the other caches"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': 0,
+            'size': 1 if self._cached else 0,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+def site_url():
+    return SITE_URL or request.url_root.rstrip('/')
+
+def _atom_date(date_obj):
+    return date_obj.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def feed_post_html(post):
+    """Sanitized HTML for a feed entry, from the compiled store when it is current"""
+    html = post_store.get_compiled(post.slug, post.sha, RENDERER_FINGERPRINT)
+    if html is None:
+        try:
+            with open(post.path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            print(f"Error reading {post.path}: {e}")
+            return None
+        html = compiled_post_html(post.slug, content, hashlib.sha256(content.encode('utf-8')).hexdigest())
+    return html
+
+def render_feed(posts, base):
+    entries = [
+        {'post': post, 'published': _atom_date(post.date_obj), 'html': feed_post_html(post)}
+        for post in posts[:FEED_ENTRIES]
+    ]
+    updated = posts[0].date_obj if posts else datetime(2024, 1, 1)
+    return render_template('feed.xml', site_url=base, entries=entries, updated=_atom_date(updated))
+
+def render_sitemap(posts, base):
+    newest = posts[0].date_obj.date().isoformat() if posts else None
+    pages_count = max(1, -(-len(posts) // POSTS_PER_PAGE))
+    pages = [(url_for('index'), newest), (url_for('blog'), newest)]
+    pages += [(url_for('blog', page=page), None) for page in range(2, pages_count + 1)]
+    pages += [(url_for('projects'), None), (url_for('about'), None)]
+    pages += [(url_for('post', slug=post.slug), post.date_obj.date().isoformat()) for post in posts]
+    return render_template('sitemap.xml', site_url=base, pages=pages)
+
+feed_document = GeneratedDocument(render_feed)
+sitemap_document = GeneratedDocument(render_sitemap)
+metrics.register_cache('feed', feed_document.stats)
+metrics.register_cache('sitemap', sitemap_document.stats)
+
+def generated_response(name, document, mimetype):
+    """Serve a GeneratedDocument with validators tied to the corpus version"""
+    posts = get_posts()
+    version, mtime = post_index.version()
+    base = site_url()
+    etag, last_modified = make_validators(f"{name}:{version}:{base}", mtime)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    body = document.get((version, base), posts, base)
+    return add_validators(Response(body, mimetype=mimetype), etag, last_modified)
+
+@app.route('/feed.xml')
+def feed():
+    return generated_response('feed', feed_document, 'application/atom+xml')
+
+@app.route('/sitemap.xml')
+def sitemap():
+    return generated_response('sitemap', sitemap_document, 'application/xml')
+
+# Full-text search and related posts, both derived from post content and
+# persisted (in instance/ unless SEARCH_INDEX / RELATED_INDEX say otherwise) so
+# workers load them instead of rebuilding
+SEARCH_RESULTS = 20
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', os.path.join(app.instance_path, 'search_index.pickle'))
+search_index = SearchIndex(SEARCH_INDEX)
+search_index.load()
+RELATED_INDEX = os.environ.get('RELATED_INDEX', os.path.join(app.instance_path, 'related_index.pickle'))
+related_index = RelatedIndex(RELATED_INDEX)
+related_index.load()
+_derived_locks = {'search': threading.Lock(), 'related': threading.Lock()}
+_derived_versions = {}
+
+def _post_document(slug):
     post = get_post_by_slug(slug)
-    if post:
-        # Remove the first line (title) from markdown content to avoid duplication
-        content_lines = post['content'].split('\n')
-        # Skip the first line if it's a heading (starts with #)
-        if content_lines and content_lines[0].startswith('#'):
-            content_without_title = '\n'.join(content_lines[1:])
+    return (post['title'], post['content']) if post else None
+
+def sync_derived_index(name, index, inline=False, **sync_options):
+    """Update only the posts that changed since the index was last synced.
+
+    The index is saved here if inline (build steps), else by a delayed
+    background save, so a request never pays for pickling the whole index.
+    """
+    refresh_posts()
+    version, _ = post_index.version()
+    if _derived_versions.get(name) == version:
+        return
+    with _derived_locks[name]:
+        if _derived_versions.get(name) == version:
+            return
+        entries = post_index.entries()
+        changes = index.sync({slug: entry.sha for slug, entry in entries.items()}, _post_document, **sync_options)
+        _derived_versions[name] = version
+    if changes:
+        if inline:
+            save_derived_index(name, index)
         else:
-            content_without_title = post['content']
-        
-        html_content = markdown.markdown(content_without_title, extensions=['fenced_code'])
-        html_content = bleach.clean(
-            html_content,
-            tags=ALLOWED_TAGS,
-            attributes=ALLOWED_ATTRIBUTES,
-            strip=True,
-        )
-        return render_template('post.html', post=post, html_content=html_content)
+            _schedule_save(name, index)
+
+def refresh_search(inline=False):
+    sync_derived_index('search', search_index, inline=inline)
+
+def refresh_related(inline=False):
+    """Sync the related-posts table; a full rebuild and the save run here only if inline, else in the background"""
+    with metrics.stage('related'):
+        sync_derived_index('related', related_index, inline=inline, rebuild=inline)
+    if related_index.rebuild_due():
+        _start_related_rebuild()
+
+# Saving pickles a whole index (19 MB and 0.4 s for search at 10k posts), so
+# after a request syncs one, a timer saves it INDEX_SAVE_DELAY seconds later,
+# once for a burst of edits. Every worker applies the same change, but only the
+# first to save writes the file: the corpus version it holds is recorded in the
+# store and the rest skip theirs. Build steps save inline, since the gunicorn
+# master must not fork with a thread running
+INDEX_SAVE_DELAY = float(os.environ.get('INDEX_SAVE_DELAY', 30))
+_pending_saves = {}
+_pending_saves_lock = threading.Lock()
+
+def save_derived_index(name, index):
+    """Save index unless another process already saved this corpus version"""
+    version = _derived_versions.get(name)
+    try:
+        with file_lock(f"{index.path}.lock"):
+            if version is not None and os.path.exists(index.path) and post_store.index_version(name) == version:
+                return
+            index.save()
+            if version is not None:
+                post_store.set_index_version(name, version)
+    except OSError as e:
+        print(f"Error saving {name} index: {e}")
+
+def _schedule_save(name, index):
+    with _pending_saves_lock:
+        timer = _pending_saves.get(name)
+        if timer is not None and timer.is_alive():
+            return  # the pending save picks this change up too
+        timer = threading.Timer(INDEX_SAVE_DELAY, _pending_save, args=(name, index))
+        timer.name = f"{name}-index-save"
+        timer.daemon = True
+        _pending_saves[name] = timer
+        timer.start()
+
+def _pending_save(name, index):
+    with _pending_saves_lock:
+        _pending_saves.pop(name, None)
+    save_derived_index(name, index)
+
+def save_pending_indexes():
+    """Run any delayed index saves now (as a worker exits)"""
+    with _pending_saves_lock:
+        pending = list(_pending_saves.values())
+        _pending_saves.clear()
+    for timer in pending:
+        timer.cancel()
+        save_derived_index(*timer.args)
+
+# A full related-posts rebuild takes seconds on a large corpus, so requests never
+# run it: a background thread builds a fresh table while the old one keeps
+# serving, then swaps it in. The file lock lets one worker rebuild while the
+# others wait and load the table it saved
+_related_rebuild = None
+_related_rebuild_lock = threading.Lock()
+
+def _rebuild_related():
+    try:
+        with file_lock(f"{RELATED_INDEX}.lock"):
+            fresh = RelatedIndex(RELATED_INDEX)
+            fresh.load()
+            entries = post_index.entries()
+            if fresh.sync({slug: entry.sha for slug, entry in entries.items()}, _post_document):
+                fresh.save()
+        with _derived_locks['related']:
+            related_index.adopt(fresh)
+            # Posts may have changed while it was built; the next sync catches up
+            _derived_versions.pop('related', None)
+    except Exception as e:
+        print(f"Error rebuilding related posts: {e}")
+
+def _start_related_rebuild():
+    global _related_rebuild
+    with _related_rebuild_lock:
+        if _related_rebuild is not None and _related_rebuild.is_alive():
+            return
+        _related_rebuild = threading.Thread(target=_rebuild_related, name='related-rebuild', daemon=True)
+        _related_rebuild.start()
+
+def related_posts(slug):
+    """PostMeta of the precomputed related posts for slug"""
+    posts = (post_index.get(other) for other, _ in related_index.related(slug))
+    return [post for post in posts if post is not None]
+
+def post_etag(sha, related):
+    """Post pages change with their own source and with their related posts'"""
+    return sha + ''.join(f":{post.sha[:12]}" for post in related)
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()[:200]
+    refresh_search()
+    version, mtime = post_index.version()
+    etag, last_modified = make_validators(f"search:{version}:{query}", mtime)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    results = []
+    terms = tokenize(query)
+    for slug, title, score in search_index.search(query, limit=SEARCH_RESULTS):
+        post = get_post_by_slug(slug)
+        if post is None:
+            continue
+        results.append({
+            'slug': slug,
+            'title': title,
+            'snippet': snippet(post['content'], terms),
+        })
+    response = make_response(render_template('search.html', query=query, results=results))
+    return add_validators(response, etag, last_modified)
+
+@app.route('/blog/<slug>')
+def post(slug):
+    refresh_posts()
+    entry = post_index.get(slug)
+    if entry is None:
+        return "Post not found", 404
+    refresh_related()
+    related = related_posts(slug)
+    etag, last_modified = make_validators(post_etag(entry.sha, related), entry.mtime)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    rendered = rendered_posts.get(entry.path)
+    if rendered:
+        # Validate against what was actually rendered; the index may lag an edit
+        etag, last_modified = make_validators(post_etag(rendered['sha'], related), rendered['mtime'])
+        post = {'title': rendered['title'], 'slug': rendered['slug']}
+        response = make_response(render_template(
+            'post.html', post=post, html_content=rendered['html'], related=related,
+        ))
+        return add_validators(response, etag, last_modified)
     else:
         return "Post not found", 404
 
@@ -283,28 +985,52 @@ def new_post():
         # Create the full markdown content with title header
         full_content = f"# {title}\n\n*{datetime.now().strftime('%B %d, %Y')} | By Cassidy Dobratz*\n\n{content}"
         
-        # Save to file
+        # Save to file atomically, then render and sanitize it once
         filename = os.path.join(POSTS_DIR, f"{slug}.md")
-        with open(filename, 'w') as f:
-            f.write(full_content)
+        atomic_write(filename, full_content)
+        compile_post(filename)
         
         return redirect(url_for('blog'))
     return render_template('new_post.html')
 
 @app.route('/contact', methods=['GET', 'POST'])
+@limiter.limit(CONTACT_RATE_LIMIT, methods=['POST'])
 def submit_contact():
     if request.method == 'POST':
-        name = request.form.get('name')
-        email = request.form.get('email')
-        message = request.form.get('message')
-        # TODO: Add your email sending logic here
-        return redirect(url_for('index'))
-    return redirect(url_for('index'))
+        # Collapse whitespace so nothing the visitor typed can break a mail header
+        name = ' '.join(request.form.get('name', '').split())[:200]
+        email = request.form.get('email', '').strip()
+        message = request.form.get('message', '').strip()
+        if not name or not message or len(email) > 254 or not EMAIL_RE.match(email):
+            return "Please provide your name, a valid email address and a message", 400
+        if mail_queue.enqueue(
+            f"Contact form: {name}",
+            f"From: {name} <{email}>\n\n{message[:CONTACT_MAX_LENGTH]}",
+            reply_to=email,
+        ) is None:
+            return "Your message could not be sent, please try again later", 503
+        return redirect(url_for('submit_contact', sent=1))
+    # The form carries a per-session CSRF token, so it must never be served from a shared cache
+    response = make_response(render_template('contact.html', sent='sent' in request.args))
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/metrics')
+@requires_auth
+def metrics_endpoint():
+    if not metrics.enabled:
+        return "Metrics are disabled", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/about')
 def about():
-    return render_template('about.html')
+    etag, last_modified = make_validators('about', 0)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    return add_validators(make_response(render_template('about.html')), etag, last_modified)
 if __name__ == '__main__':
     # Get port from environment variable or default to 5000
     port = int(os.environ.get('PORT', 8000))
+    mail_queue.start()
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmarks for CassidyBlog
+Usage: python bench.py generate DIR [--posts N]          # write a synthetic corpus
+       python bench.py run [--posts N] [--output FILE]   # benchmark the app
+       python bench.py run --gunicorn --workers 2        # ...through a local gunicorn
+       python bench.py compare OLD.json NEW.json         # diff two result files
+       python bench.py build [--posts 5000] [--workers 1,4]  # serial vs parallel corpus build
+       python bench.py related [--posts 1000,10000]       # related-posts build time and memory
+
+Synthetic posts follow the format add_post.py writes (H1 title, italic date
+line, then markdown with headings, fenced code and tables). The app is pointed
+at the corpus through the POSTS_DIR environment variable, so the real content
+directory is never touched (and BLOG_DB, SEARCH_INDEX and RELATED_INDEX at
+scratch files). Results are written as JSON so runs can be compared.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from add_post import create_slug
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FORMAT = 1
+
+WORDS = """
+data pipeline model feature training inference latency throughput cluster stream
+batch warehouse lake schema query index partition shard replica cache queue event
+metric dashboard anomaly forecast regression classifier embedding vector token
+transformer gradient loss accuracy precision recall baseline drift monitoring
+airflow spark kafka postgres mongodb redis docker kubernetes terraform lambda
+python rust sql fastapi flask react api endpoint service deployment container
+security encryption privacy compliance audit governance lineage quality contract
+customer revenue risk fraud claims patient provider market signal portfolio
+""".split()
+
+TITLE_WORDS = """
+Building Scaling Understanding Designing Testing Shipping Monitoring Debugging
+Real-Time Production Distributed Streaming Practical Modern Reliable Secure
+Pipelines Models Dashboards Warehouses Agents Systems Platforms Analytics
+""".split()
+
+ROUTE_MIX = [('index', 0.1), ('blog', 0.2), ('post', 0.6), ('missing', 0.1)]
+
+
+# Corpus generation
+
+def _sentence(rng, low=8, high=20):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng):
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+
+
+def _code_block(rng):
+    name = rng.choice(WORDS)
+    lines = [
+        '```python',
+        f'def {name}_{rng.choice(WORDS)}(records):',
+        f'    """{_sentence(rng, 4, 8)}"""',
+        f'    {name} = [r for r in records if r.get("{rng.choice(WORDS)}")]',
+        f'    return sorted({name}, key=lambda r: r["{rng.choice(WORDS)}"])',
+        '```',
+    ]
+    return '\n'.join(lines)
+
+
+def _table(rng):
+    columns = rng.sample(WORDS, 3)
+    rows = [
+        '| ' + ' | '.join(c.title() for c in columns) + ' |',
+        '|' + '---|' * len(columns),
+    ]
+    for _ in range(rng.randint(3, 6)):
+        rows.append('| ' + ' | '.join(f"{rng.random():.3f}" for _ in columns) + ' |')
+    return '\n'.join(rows)
+
+
+def synthetic_post(rng, number):
+    """Return (title, markdown) for one synthetic post in add_post.py's format"""
+    title = ' '.join(rng.sample(TITLE_WORDS, 3)) + f" {rng.choice(WORDS).title()} {number}"
+    date = datetime(2020, 1, 1) + timedelta(days=rng.randrange(2200))
+    blocks = []
+    for _ in range(rng.randint(4, 7)):
+        blocks.append(f"## {_sentence(rng, 3, 6).rstrip('.')}")
+        for _ in range(rng.randint(3, 5)):
+            blocks.append(_paragraph(rng))
+        roll = rng.random()
+        if roll < 0.4:
+            blocks.append(_code_block(rng))
+        elif roll < 0.7:
+            blocks.append(_table(rng))
+    content = '\n\n'.join(blocks)
+    return title, f"""# {title}
+
+*{date.strftime('%B %d, %Y')} | By Cassidy Dobratz*
+
+{content}
+"""
+
+
+def generate_corpus(directory, count, seed=0):
+    """Write count synthetic posts into directory; returns their slugs"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    slugs = []
+    for number in range(count):
+        title, markdown_text = synthetic_post(rng, number)
+        slug = create_slug(title)
+        with open(os.path.join(directory, f"{slug}.md"), 'w', encoding='utf-8') as f:
+            f.write(markdown_text)
+        slugs.append(slug)
+    return slugs
+
+
+# Measurement helpers
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, elapsed=None):
+    """Latency percentiles (ms) and throughput for a list of seconds"""
+    ms = [value * 1000 for value in latencies]
+    summary = {
+        'requests': len(ms),
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'mean_ms': statistics.fmean(ms) if ms else None,
+        'max_ms': max(ms) if ms else None,
+    }
+    if elapsed:
+        summary['throughput_rps'] = len(ms) / elapsed
+    return summary
+
+
+def rss_kb(pid='self'):
+    """Resident set size of a process in KiB, from /proc where available"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid == 'self':
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage // 1024 if sys.platform == 'darwin' else usage
+    return None
+
+
+def child_pids(parent):
+    """PIDs whose parent is `parent` (gunicorn workers), via /proc"""
+    pids = []
+    for name in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            pids.append(int(name))
+    return pids
+
+
+def request_plan(slugs, count, seed):
+    """Deterministic list of (kind, path) following ROUTE_MIX"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in ROUTE_MIX]
+    weights = [weight for _, weight in ROUTE_MIX]
+    plan = []
+    for number in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'index':
+            path = '/'
+        elif kind == 'blog':
+            path = '/blog'
+        elif kind == 'post':
+            path = f"/blog/{rng.choice(slugs)}"
+        else:
+            path = f"/blog/no-such-post-{number}"
+        plan.append((kind, path))
+    return plan
+
+
+def run_plan(send, plan, concurrency=1):
+    """Issue every request in plan through send(path) -> status; returns results by kind"""
+    latencies = {kind: [] for kind, _ in ROUTE_MIX}
+    errors = []
+
+    def one(item):
+        kind, path = item
+        start = time.perf_counter()
+        status = send(path)
+        latency = time.perf_counter() - start
+        expected = 404 if kind == 'missing' else 200
+        return kind, path, status, expected, latency
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, plan))
+    else:
+        results = [one(item) for item in plan]
+    elapsed = time.perf_counter() - start
+
+    for kind, path, status, expected, latency in results:
+        latencies[kind].append(latency)
+        if status != expected:
+            errors.append({'path': path, 'status': status})
+
+    routes = {kind: summarize(values) for kind, values in latencies.items() if values}
+    overall = summarize([lat for values in latencies.values() for lat in values], elapsed)
+    return {'routes': routes, 'overall': overall, 'errors': len(errors), 'error_samples': errors[:5]}
+
+
+# Flask test client
+
+def cold_start(posts_dir, slug):
+    """Import the app and serve its first requests in a fresh interpreter"""
+    code = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+first = client.get('/blog')
+listed = time.perf_counter()
+post = client.get('/blog/' + {slug!r})
+done = time.perf_counter()
+sys.path.insert(0, {ROOT_DIR!r})
+from bench import rss_kb
+print(json.dumps({{
+    'import_s': imported - start,
+    'first_listing_s': listed - imported,
+    'first_post_s': done - listed,
+    'total_s': done - start,
+    'status': [first.status_code, post.status_code],
+    'rss_kb': rss_kb(),
+}}))
+"""
+    env = dict(os.environ, POSTS_DIR=posts_dir)
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_test_client(posts_dir, slugs, args):
+    """Cold starts in subprocesses, then warm latencies in this process"""
+    colds = [cold_start(posts_dir, slugs[0]) for _ in range(args.cold_runs)]
+    cold = {
+        key: statistics.median(run[key] for run in colds)
+        for key in ('import_s', 'first_listing_s', 'first_post_s', 'total_s')
+    }
+    cold['runs'] = colds
+
+    os.environ['POSTS_DIR'] = posts_dir
+    import app as blog_app
+    client = blog_app.app.test_client()
+
+    def send(path):
+        return client.get(path).status_code
+
+    run_plan(send, request_plan(slugs, args.warmup, args.seed + 1))
+    warm = run_plan(send, request_plan(slugs, args.requests, args.seed))
+    warm['rss_kb'] = rss_kb()
+    return {'cold_start': cold, 'warm': warm}
+
+
+# Gunicorn
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_gunicorn(posts_dir, slugs, args):
+    """Start a local gunicorn, time its first response, then load it over HTTP"""
+    if shutil.which('gunicorn') is None:
+        raise SystemExit("gunicorn is not installed (pip install -r requirements.txt)")
+    port = _free_port()
+    env = dict(os.environ, POSTS_DIR=posts_dir)
+    command = ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers), 'app:app']
+    if args.preload:
+        command.insert(1, '--preload')
+
+    local = threading.local()
+
+    def send(path):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            local.conn = None
+            return None
+
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        status = None
+        while status != 200:
+            if server.poll() is not None:
+                raise SystemExit("gunicorn exited during startup")
+            if time.perf_counter() - start > 120:
+                raise SystemExit("gunicorn did not answer within 120s")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('GET', '/blog')
+                status = conn.getresponse().status
+                conn.close()
+            except OSError:
+                time.sleep(0.05)
+        cold = {'first_listing_s': time.perf_counter() - start}
+
+        run_plan(send, request_plan(slugs, args.warmup, args.seed + 1), args.concurrency)
+        warm = run_plan(send, request_plan(slugs, args.requests, args.seed), args.concurrency)
+        warm['rss_kb'] = {
+            'master': rss_kb(server.pid),
+            'workers': [rss_kb(pid) for pid in child_pids(server.pid)],
+        }
+        return {'cold_start': cold, 'warm': warm}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# Commands
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def command_generate(args):
+    slugs = generate_corpus(args.directory, args.posts, args.seed)
+    print(f"✅ Wrote {len(slugs)} synthetic posts to {args.directory}")
+
+
+def _scratch_instance(tmp_dir):
+    """Point the app's database and index pickles at tmp_dir instead of instance/"""
+    os.environ.setdefault('BLOG_DB', os.path.join(tmp_dir, 'blog.db'))
+    os.environ.setdefault('SEARCH_INDEX', os.path.join(tmp_dir, 'search_index.pickle'))
+    os.environ.setdefault('RELATED_INDEX', os.path.join(tmp_dir, 'related_index.pickle'))
+
+
+def command_run(args):
+    tmp_dir = tempfile.mkdtemp(prefix='cassidyblog-bench-')
+    # Keep compiled HTML and derived indexes for the benchmark corpus out of instance/
+    _scratch_instance(tmp_dir)
+    posts_dir = args.posts_dir
+    if posts_dir is None:
+        posts_dir = os.path.join(tmp_dir, 'posts')
+        generate_corpus(posts_dir, args.posts, args.seed)
+    slugs = sorted(name[:-3] for name in os.listdir(posts_dir) if name.endswith('.md'))
+    if not slugs:
+        raise SystemExit(f"No posts found in {posts_dir}")
+
+    try:
+        if args.gunicorn:
+            target = {'server': 'gunicorn', 'workers': args.workers, 'preload': args.preload,
+                      'concurrency': args.concurrency}
+            results = bench_gunicorn(posts_dir, slugs, args)
+        else:
+            target = {'server': 'flask-test-client', 'concurrency': 1}
+            results = bench_test_client(posts_dir, slugs, args)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    report = {
+        'format': RESULTS_FORMAT,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'posts': len(slugs), 'seed': args.seed, 'synthetic': args.posts_dir is None},
+        'plan': {'requests': args.requests, 'warmup': args.warmup, 'seed': args.seed,
+                 'mix': dict(ROUTE_MIX)},
+        'target': target,
+        **results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    overall = report['warm']['overall']
+    print(f"=== {target['server']} · {len(slugs)} posts · {overall['requests']} requests ===")
+    for kind, stats in report['warm']['routes'].items():
+        print(f"{kind:<8} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+              f"p99 {stats['p99_ms']:8.3f} ms  (n={stats['requests']})")
+    print(f"overall  {overall['throughput_rps']:.1f} req/s, errors: {report['warm']['errors']}")
+    print(f"cold start: {json.dumps({k: v for k, v in report['cold_start'].items() if k != 'runs'})}")
+    print(f"\n📝 Results written to {args.output}")
+
+
+def command_compare(args):
+    with open(args.old, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    def delta(a, b):
+        if a in (None, 0) or b is None:
+            return '    n/a'
+        return f"{(b - a) / a * 100:+6.1f}%"
+
+    print(f"{'route':<8} {'metric':<7} {'old':>10} {'new':>10} {'change':>8}")
+    routes = sorted(set(old['warm']['routes']) | set(new['warm']['routes']))
+    for kind in routes + ['overall']:
+        a = old['warm']['overall'] if kind == 'overall' else old['warm']['routes'].get(kind, {})
+        b = new['warm']['overall'] if kind == 'overall' else new['warm']['routes'].get(kind, {})
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if metric in a or metric in b:
+                print(f"{kind:<8} {metric[:-3] if metric.endswith('_ms') else 'rps':<7} "
+                      f"{a.get(metric, 0) or 0:>10.3f} {b.get(metric, 0) or 0:>10.3f} "
+                      f"{delta(a.get(metric), b.get(metric)):>8}")
+
+
+def command_build(args):
+    tmp_dir = tempfile.mkdtemp(prefix='cassidyblog-build-')
+    _scratch_instance(tmp_dir)
+    posts_dir = os.path.join(tmp_dir, 'posts')
+    generate_corpus(posts_dir, args.posts, args.seed)
+    # One unreadable file shows that a bad post is reported, not fatal
+    with open(os.path.join(posts_dir, 'zz-broken.md'), 'wb') as f:
+        f.write(b'# Broken\n\xff\xfe not utf-8\n')
+    os.environ['POSTS_DIR'] = posts_dir
+    os.environ['INDEX_BUILD_WORKERS'] = '1'
+    import app as blog_app
+
+    files = [os.path.join(posts_dir, name) for name in os.listdir(posts_dir) if name.endswith('.md')]
+    workers = [int(n) for n in args.workers.split(',')]
+    rows = []
+    reference = {}
+    identical = True
+    try:
+        for stage, render in (('parse', False), ('parse+render', True)):
+            serial = None
+            for count in workers:
+                start = time.perf_counter()
+                results = blog_app.build_posts(files, render=render, workers=count, min_files=0)
+                elapsed = time.perf_counter() - start
+                merged = [(file, entry.row() if entry else None, html, error)
+                          for file, entry, html, error in results]
+                if stage in reference:
+                    identical = identical and merged == reference[stage]
+                else:
+                    reference[stage] = merged
+                serial = serial or elapsed
+                rows.append({
+                    'stage': stage,
+                    'workers': count,
+                    'seconds': elapsed,
+                    'speedup': serial / elapsed,
+                    'errors': sum(1 for result in results if result[3]),
+                })
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    report = {
+        'format': RESULTS_FORMAT,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'corpus': {'posts': len(files), 'seed': args.seed, 'synthetic': True},
+        'build': rows,
+        'identical': identical,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"=== corpus build · {len(files)} files · {os.cpu_count()} CPU(s) ===")
+    for row in rows:
+        print(f"{row['stage']:<13} workers {row['workers']:>2}  {row['seconds']:8.3f} s  "
+              f"x{row['speedup']:.2f}  errors {row['errors']}")
+    print(f"parallel output identical to serial: {identical}")
+    print(f"\n📝 Results written to {args.output}")
+
+
+def _related_run(documents, seed):
+    """Build a RelatedIndex over {slug: (title, content)}; returns its measurements"""
+    from related import RelatedIndex
+
+    entries = {slug: f"v0:{slug}" for slug in documents}
+    load = documents.get
+
+    start = time.perf_counter()
+    index = RelatedIndex()
+    index.sync(entries, load)
+    build_s = time.perf_counter() - start
+
+    # Memory held by the finished table (and the peak while building it)
+    tracemalloc.start()
+    measured = RelatedIndex()
+    measured.sync(entries, load)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+
+    # Edit a few posts one at a time, as /blog/new or an in-place edit would
+    rng = random.Random(seed)
+    updates = []
+    for slug in rng.sample(sorted(documents), min(10, len(documents))):
+        title, content = documents[slug]
+        documents[slug] = (title, content + '\n\n' + _paragraph(rng))
+        entries = dict(entries, **{slug: f"v1:{slug}"})
+        start = time.perf_counter()
+        index.sync(entries, load)
+        updates.append(time.perf_counter() - start)
+    incremental = {slug: {other for other, _ in index.related(slug)} for slug in documents}
+    index.rebuild()
+    overlap = sum(len(incremental[slug] & {other for other, _ in index.related(slug)})
+                  for slug in documents)
+    kept = sum(len(index.related(slug)) for slug in documents)
+
+    slugs = list(documents)
+    start = time.perf_counter()
+    for slug in slugs:
+        index.related(slug)
+    lookup_s = (time.perf_counter() - start) / len(slugs)
+
+    return {
+        'posts': len(documents),
+        'build_s': build_s,
+        'retained_mb': retained / 1024 / 1024,
+        'peak_mb': peak / 1024 / 1024,
+        'update_ms_p50': statistics.median(updates) * 1000,
+        'update_ms_max': max(updates) * 1000,
+        'lookup_us': lookup_s * 1e6,
+        'incremental_vs_rebuild_overlap': overlap / kept if kept else 1.0,
+    }
+
+
+def command_related(args):
+    rows = []
+    for count in (int(n) for n in args.posts.split(',')):
+        rng = random.Random(args.seed)
+        documents = {}
+        for number in range(count):
+            title, markdown_text = synthetic_post(rng, number)
+            documents[create_slug(title)] = (title, markdown_text)
+        rows.append(_related_run(documents, args.seed))
+
+    report = {
+        'format': RESULTS_FORMAT,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'related': rows,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'posts':>7} {'build s':>8} {'kept MB':>8} {'peak MB':>8} {'update ms':>10} "
+          f"{'lookup us':>10} {'overlap':>8}")
+    for row in rows:
+        print(f"{row['posts']:>7} {row['build_s']:>8.2f} {row['retained_mb']:>8.1f} {row['peak_mb']:>8.1f} "
+              f"{row['update_ms_p50']:>10.1f} {row['lookup_us']:>10.2f} "
+              f"{row['incremental_vs_rebuild_overlap']:>8.3f}")
+    print(f"\n📝 Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CassidyBlog benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='write a synthetic post corpus')
+    generate.add_argument('directory')
+    generate.add_argument('--posts', type=int, default=1000)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.set_defaults(func=command_generate)
+
+    run = commands.add_parser('run', help='measure latency, throughput, memory and cold start')
+    run.add_argument('--posts', type=int, default=1000, help='synthetic corpus size')
+    run.add_argument('--posts-dir', help='benchmark an existing posts directory instead')
+    run.add_argument('--requests', type=int, default=2000)
+    run.add_argument('--warmup', type=int, default=200)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--cold-runs', type=int, default=3)
+    run.add_argument('--gunicorn', action='store_true', help='drive a local gunicorn over HTTP')
+    run.add_argument('--workers', type=int, default=2)
+    run.add_argument('--preload', action='store_true', help='pass --preload to gunicorn')
+    run.add_argument('--concurrency', type=int, default=4)
+    run.add_argument('--output', default='bench_results.json')
+    run.set_defaults(func=command_run)
+
+    compare = commands.add_parser('compare', help='diff two result files')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.set_defaults(func=command_compare)
+
+    build = commands.add_parser('build', help='time the serial vs parallel cold-start build')
+    build.add_argument('--posts', type=int, default=5000)
+    build.add_argument('--seed', type=int, default=0)
+    build.add_argument('--workers', default=f"1,{max(2, os.cpu_count() or 1)}",
+                       help='comma-separated process counts; the first is the baseline')
+    build.add_argument('--output', default='bench_results_build.json')
+    build.set_defaults(func=command_build)
+
+    related = commands.add_parser('related', help='time and size the related-posts table')
+    related.add_argument('--posts', default='1000,10000', help='comma-separated corpus sizes')
+    related.add_argument('--seed', type=int, default=0)
+    related.add_argument('--output', default='bench_results_related.json')
+    related.set_defaults(func=command_related)
+
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Response compression for CassidyBlog
+Usage: python compression.py build      # write precompressed .gz siblings under static/
+       python compression.py bench      # compare CPU time vs bytes saved per level
+
+Rendered pages are compressed according to Accept-Encoding and, when they
+carry an ETag, the compressed body is kept in a bounded cache so the same page
+is never compressed twice. Static files are served under content-versioned
+names (styles.<hash>.css) with an immutable Cache-Control, and from a
+precompressed .gz sibling when one has been built (otherwise compressed once
+and kept in the same cache).
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Preferred first; best_match() still honours the client's q-values
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml',
+    'application/atom+xml', 'application/rss+xml', 'image/svg+xml',
+}
+
+# Bodies smaller than this aren't worth the CPU or the extra header bytes
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+CACHE_BYTES = int(os.environ.get('COMPRESS_CACHE_BYTES', 16 * 1024 * 1024))
+
+STATIC_MAX_AGE = 31536000
+VERSIONED_RE = re.compile(r'^(?P<stem>.+)\.(?P<version>[0-9a-f]{8})(?P<ext>\.[A-Za-z0-9]+)$')
+
+# Precompressed siblings are only worth building for text formats
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.xml', '.json', '.ico'}
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with the given content-coding"""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def etag_variants(etag):
+    """Every ETag a representation of etag may have been sent with"""
+    return [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]
+
+
+def negotiate_encoding():
+    """Best content-coding the client accepts, or None"""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+class CompressedResponseCache:
+    """LRU cache of compressed bodies keyed by (ETag, encoding), bounded in bytes"""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compress(self, key, data, encoding):
+        """Return the cached compressed body for key, compressing data on a miss"""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+
+        body = compress(data, encoding)
+        if len(body) > self.max_bytes:
+            return body
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = body
+                self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+        return body
+
+    def stats(self):
+        """Hit/miss/eviction counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+compressed_responses = CompressedResponseCache()
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses for the negotiated encoding"""
+    if response.status_code == 304:
+        # Echo back the variant ETag the client validated, if any
+        etag, _ = response.get_etag()
+        if etag and request.if_none_match:
+            for variant in etag_variants(etag)[1:]:
+                if request.if_none_match.contains(variant):
+                    response.set_etag(variant)
+                    break
+        return response
+
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        body = compressed_responses.get_or_compress((etag, encoding), data, encoding)
+        response.set_etag(f"{etag}-{encoding}")
+    else:
+        body = compress(data, encoding)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class StaticVersions:
+    """Content hashes for files under static/, refreshed when a file changes"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def version(self, filename):
+        """Short content hash of a static file, or None if it doesn't exist"""
+        path = safe_join(self.static_dir, filename)
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return None
+        key = (st.st_mtime, st.st_size)
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(path, 'rb') as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:8]
+        with self._lock:
+            self._hashes[filename] = (key, version)
+        return version
+
+    def versioned_name(self, filename):
+        """styles.css -> styles.<hash>.css; unchanged if the file is missing"""
+        version = self.version(filename)
+        if version is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{version}{ext}"
+
+    def resolve(self, filename):
+        """Map a versioned name back to (real filename, is_current_version)"""
+        match = VERSIONED_RE.match(filename)
+        if match:
+            real = match.group('stem') + match.group('ext')
+            version = self.version(real)
+            if version is not None:
+                return real, version == match.group('version')
+        return filename, False
+
+
+def compressed_static(path, version, mimetype, encoding):
+    """Serve a static file without a prebuilt sibling, compressed once into compressed_responses"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_SIZE:
+        return None
+    body = compressed_responses.get_or_compress((f"static:{path}:{version}", encoding), data, encoding)
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.headers['Content-Encoding'] = encoding
+    response.set_etag(f"{version}-{encoding}")
+    response.last_modified = int(os.path.getmtime(path))
+    return response.make_conditional(request)
+
+
+def init_compression(app):
+    """Install response compression and versioned, precompressed static files"""
+    versions = StaticVersions(app.static_folder)
+    app.extensions['static_versions'] = versions
+
+    @app.url_defaults
+    def version_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = versions.versioned_name(values['filename'])
+
+    def serve_static(filename):
+        real, current = versions.resolve(filename)
+        path = safe_join(app.static_folder, real)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        response = None
+        encoding = negotiate_encoding()
+        mimetype = mimetypes.guess_type(real)[0] or 'application/octet-stream'
+        for suffix, coding in (('.br', 'br'), ('.gz', 'gzip')):
+            if encoding != coding:
+                continue
+            sibling = path + suffix
+            try:
+                fresh = os.path.getmtime(sibling) >= os.path.getmtime(path)
+            except OSError:
+                fresh = False
+            if fresh:
+                response = send_file(sibling, mimetype=mimetype, conditional=True)
+                response.headers['Content-Encoding'] = coding
+            break
+        compressible = mimetype in COMPRESSIBLE_TYPES or os.path.splitext(real)[1].lower() in PRECOMPRESS_EXTENSIONS
+        if response is None and encoding and compressible:
+            response = compressed_static(path, versions.version(real), mimetype, encoding)
+        if response is None:
+            response = send_file(path, mimetype=mimetype, conditional=True)
+
+        if compressible:
+            response.vary.add('Accept-Encoding')
+        if current:
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        return response
+
+    app.view_functions['static'] = serve_static
+    app.after_request(compress_response)
+    return versions
+
+
+def build_static(static_dir, min_size=MIN_SIZE):
+    """Write .gz (and .br, if available) siblings for compressible static files"""
+    written = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < min_size:
+                continue
+            for encoding, suffix, level in (('gzip', '.gz', 9), ('br', '.br', 11)):
+                if encoding not in ENCODINGS:
+                    continue
+                body = compress(data, encoding, level=level)
+                if len(body) >= len(data):
+                    continue
+                tmp_path = path + suffix + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path + suffix)
+                written.append((os.path.relpath(path + suffix, static_dir), len(data), len(body)))
+    return written
+
+
+def benchmark(samples, rounds=20):
+    """Time each encoding/level over named byte samples; returns result rows"""
+    levels = [('gzip', level) for level in (1, 6, 9)]
+    if brotli:
+        levels += [('br', quality) for quality in (1, 5, 11)]
+    rows = []
+    for name, data in samples:
+        for encoding, level in levels:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                body = compress(data, encoding, level=level)
+            elapsed = (time.perf_counter() - start) / rounds
+            rows.append({
+                'sample': name,
+                'encoding': encoding,
+                'level': level,
+                'original_bytes': len(data),
+                'compressed_bytes': len(body),
+                'ratio': len(body) / len(data),
+                'ms': elapsed * 1000,
+            })
+    return rows
+
+
+def _benchmark_samples():
+    from app import app, get_posts
+
+    client = app.test_client()
+    samples = []
+    routes = ['/', '/blog']
+    posts = get_posts()
+    if posts:
+        routes.append(f"/blog/{posts[0].slug}")
+    for route in routes:
+        samples.append((route, client.get(route).get_data()))
+    for name in ('styles.css', 'js/cursor.js'):
+        with open(os.path.join(app.static_folder, name), 'rb') as f:
+            samples.append((f"static/{name}", f.read()))
+    return samples
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+    if command == 'build':
+        written = build_static(static_dir)
+        for rel, original, compressed in written:
+            print(f"✅ {rel}: {original} -> {compressed} bytes")
+        print(f"\n{len(written)} precompressed file(s) written")
+    elif command == 'bench':
+        print(f"{'sample':<28} {'enc':<5} {'lvl':>3} {'bytes':>8} {'out':>8} {'ratio':>6} {'ms':>7}")
+        for row in benchmark(_benchmark_samples()):
+            print(f"{row['sample'][:28]:<28} {row['encoding']:<5} {row['level']:>3} "
+                  f"{row['original_bytes']:>8} {row['compressed_bytes']:>8} "
+                  f"{row['ratio']:>6.2f} {row['ms']:>7.3f}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Freeze CassidyBlog into a directory of static HTML files
+Usage: python freeze.py [output_dir] [--full]
+
+Every public route is rendered through the Flask app (the same templates and
+post() pipeline gunicorn serves), static/ is copied alongside, and a
+manifest.json records what was written. Later runs only re-render posts whose
+source file changed, unless the templates, app code or a static file changed
+too (pages link static files by content hash). Set
+SITE_URL (e.g. https://example.com) so the feed and sitemap carry the real
+site's absolute URLs.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from app import app, get_posts, related_posts, refresh_related, BUILD_FINGERPRINT, POSTS_PER_PAGE
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+DEFAULT_OUTPUT = os.path.join(ROOT_DIR, 'build')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Pages that don't depend on a single post; always re-rendered (they are cheap)
+STATIC_ROUTES = ['/', '/blog', '/about', '/projects']
+# Written under their own names rather than as <route>/index.html
+DOCUMENT_ROUTES = ['/feed.xml', '/sitemap.xml']
+SKIP_FILES = {'.DS_Store'}
+
+
+def route_to_file(route):
+    """Map a URL path to the file a static server will serve for it"""
+    path = route.strip('/')
+    return os.path.join(path, 'index.html') if path else 'index.html'
+
+
+def load_manifest(output_dir):
+    """Return the previous build's manifest, or an empty one"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'fingerprint': None, 'pages': {}, 'static': {}}
+
+
+def write_if_changed(path, data):
+    """Write bytes to path unless it already holds them; returns True if written"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def render_page(client, output_dir, route, file=None, expected_status=200):
+    """Render one route to disk and return its manifest record, or None on error"""
+    response = client.get(route)
+    if response.status_code != expected_status:
+        print(f"Error rendering {route}: HTTP {response.status_code}")
+        return None
+    file = file or route_to_file(route)
+    data = response.get_data()
+    write_if_changed(os.path.join(output_dir, file), data)
+    return {'file': file, 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def copy_static(output_dir, previous):
+    """Copy changed files under static/ into the build; returns the new records"""
+    static_versions = app.extensions['static_versions']
+    records = {}
+    copied = 0
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name in SKIP_FILES:
+                continue
+            src = os.path.join(dirpath, name)
+            rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, '/')
+            st = os.stat(src)
+            dest = os.path.join(output_dir, 'static', rel)
+            # Pages link to content-versioned names (see compression.py)
+            versioned = static_versions.versioned_name(rel)
+            record = {'mtime': st.st_mtime, 'size': st.st_size, 'versioned': versioned}
+            versioned_dest = os.path.join(output_dir, 'static', versioned)
+            if previous.get(rel) != record or not os.path.exists(dest):
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copy2(src, dest)
+                copied += 1
+            if versioned != rel and not os.path.exists(versioned_dest):
+                shutil.copy2(src, versioned_dest)
+            records[rel] = record
+
+    for rel, old in previous.items():
+        if rel not in records:
+            remove_output(output_dir, os.path.join('static', rel))
+        if old.get('versioned') not in (None, rel, records.get(rel, {}).get('versioned')):
+            remove_output(output_dir, os.path.join('static', old['versioned']))
+    return records, copied
+
+
+def remove_output(output_dir, file):
+    """Delete a previously written file and any directories it leaves empty"""
+    path = os.path.join(output_dir, file)
+    try:
+        os.remove(path)
+    except OSError:
+        return
+    parent = os.path.dirname(path)
+    while parent != output_dir:
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def freeze(output_dir=DEFAULT_OUTPUT, full=False):
+    """Render the site into output_dir and return a summary dict"""
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    # Templates leave out what needs the running app (the /search and /contact forms)
+    app.config['STATIC_EXPORT'] = True
+
+    previous = load_manifest(output_dir)
+    fingerprint = BUILD_FINGERPRINT
+    if full or previous['fingerprint'] != fingerprint:
+        previous['pages'] = {}
+
+    client = app.test_client()
+    pages = {}
+    rendered = skipped = errors = 0
+
+    posts = get_posts()
+    pages_count = max(1, -(-len(posts) // POSTS_PER_PAGE))
+    listing_routes = [f"/blog/page/{page}" for page in range(2, pages_count + 1)]
+    for route in STATIC_ROUTES + listing_routes:
+        record = render_page(client, output_dir, route)
+        if record is None:
+            errors += 1
+            continue
+        pages[route] = record
+        rendered += 1
+
+    for route in DOCUMENT_ROUTES:
+        record = render_page(client, output_dir, route, file=route.lstrip('/'))
+        if record is None:
+            errors += 1
+            continue
+        pages[route] = record
+        rendered += 1
+
+    refresh_related(inline=True)
+    for post in posts:
+        route = f"/blog/{post.slug}"
+        # A post page also shows its related posts, so re-render when they change
+        related = [f"{other.slug}:{other.sha}" for other in related_posts(post.slug)]
+        source = {'mtime': post.mtime, 'size': post.size, 'related': related}
+        old = previous['pages'].get(route)
+        if old and old.get('source') == source and os.path.exists(os.path.join(output_dir, old['file'])):
+            pages[route] = old
+            skipped += 1
+            continue
+        record = render_page(client, output_dir, route)
+        if record is None:
+            errors += 1
+            continue
+        record['source'] = source
+        pages[route] = record
+        rendered += 1
+
+    # A static server can return this for unknown paths
+    record = render_page(client, output_dir, '/blog/__missing__', file='404.html', expected_status=404)
+    if record is not None:
+        pages['404'] = record
+
+    written = {record['file'] for record in pages.values()}
+    for old in previous['pages'].values():
+        if old['file'] not in written:
+            remove_output(output_dir, old['file'])
+
+    static_records, copied = copy_static(output_dir, previous.get('static', {}))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'fingerprint': fingerprint,
+        'pages': pages,
+        'static': static_records,
+    }
+    write_if_changed(
+        os.path.join(output_dir, MANIFEST_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'),
+    )
+    return {
+        'output_dir': output_dir,
+        'rendered': rendered,
+        'skipped': skipped,
+        'errors': errors,
+        'static_copied': copied,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Freeze CassidyBlog to static HTML')
+    parser.add_argument('output_dir', nargs='?', default=DEFAULT_OUTPUT,
+                        help='directory to write the site into (default: build/)')
+    parser.add_argument('--full', action='store_true',
+                        help='re-render every page, ignoring the previous manifest')
+    args = parser.parse_args()
+
+    print("=== CassidyBlog Static Export ===\n")
+    summary = freeze(args.output_dir, full=args.full)
+    print(f"📁 Output: {summary['output_dir']}")
+    print(f"📝 Pages rendered: {summary['rendered']} (unchanged posts skipped: {summary['skipped']})")
+    print(f"🗂  Static files copied: {summary['static_copied']}")
+    if summary['errors']:
+        print(f"\n❌ {summary['errors']} page(s) failed to render")
+        return 1
+    print("\n✅ Site frozen. Serve the output directory with any static file server.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
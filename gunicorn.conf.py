@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for CassidyBlog (read automatically from the working directory)
+
+With --preload the app is imported once in the master process; building the
+post index there, before any worker is forked, means the corpus is parsed (or
+loaded from instance/blog.db) once and every worker starts with it in memory.
+The same goes for the search index and the related-posts table. The master
+closes its database connection before each fork, so no worker inherits one.
+
+Each worker starts its own contact-form mail sender thread once forked, so mail
+queued before a restart goes out without waiting for a new message.
+"""
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app import post_index, refresh_search, refresh_related
+    posts = post_index.entries()
+    refresh_search(inline=True)
+    refresh_related(inline=True)
+    server.log.info("Post index ready: %d posts", len(posts))
+
+
+def pre_fork(server, worker):
+    # SQLite connections must not be carried across fork(); workers open their own
+    if not server.cfg.preload_app:
+        return
+    from app import post_store
+    post_store.close()
+
+
+def post_worker_init(worker):
+    from app import mail_queue
+    mail_queue.start()
+
+
+def worker_exit(server, worker):
+    from app import mail_queue, save_pending_indexes
+    mail_queue.stop()
+    save_pending_indexes()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Outbound mail queue for CassidyBlog
+Usage: python mail_queue.py status                 # messages queued, sent and failed
+       python mail_queue.py drain                  # send everything that is due, then exit
+       python mail_queue.py sink [--port 1025] [--reject N]
+                                                   # local stand-in SMTP server that prints mail
+
+A request never talks to the SMTP server: the contact form appends the message
+to the outbound_mail table of instance/blog.db and returns. A daemon thread in
+each worker claims due messages in batches and sends them over one SMTP
+connection that is kept open between batches. A failed send is retried with
+exponential backoff (MAIL_RETRY_BASE seconds, doubling) until MAIL_MAX_ATTEMPTS;
+a permanent (5xx) rejection of the message itself, at MAIL, RCPT or DATA, is
+given up at once. When the server cannot be reached or refuses the session
+(connect, TLS, login) the batch is put back, with backoff, without counting an
+attempt against any message. Claims expire after MAIL_LEASE seconds, so mail
+held by a worker that died is picked up again.
+
+SMTP is configured through MAIL_SMTP_HOST, MAIL_SMTP_PORT, MAIL_SMTP_USER,
+MAIL_SMTP_PASSWORD and MAIL_SMTP_STARTTLS (on by default when a user is set);
+mail goes from MAIL_FROM to MAIL_TO. Without a host and recipient messages are
+still queued, and are sent once mail is configured.
+"""
+
+import os
+import smtplib
+import socketserver
+import sys
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 20))
+POLL_INTERVAL = float(os.environ.get('MAIL_POLL_INTERVAL', 5))
+MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 8))
+RETRY_BASE = float(os.environ.get('MAIL_RETRY_BASE', 30))
+RETRY_MAX = 3600
+LEASE = float(os.environ.get('MAIL_LEASE', 300))
+
+# Close the pooled connection once it has been idle this long; servers drop idle clients anyway
+SMTP_IDLE = 60
+SMTP_TIMEOUT = 10
+
+# Delivered messages are kept this long, then pruned
+SENT_RETENTION = 30 * 86400
+
+# Replies to MAIL, RCPT and DATA: the only errors that are about the message itself.
+# Everything else (socket errors, connect, HELO, STARTTLS, login, a dropped
+# session) is about the server or our credentials and says nothing of the message
+MESSAGE_ERRORS = (smtplib.SMTPSenderRefused, smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _permanent(error):
+    """A 5xx reply to the message, or a malformed one, will not change on a retry; 4xx might"""
+    if isinstance(error, ValueError):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)) and error.smtp_code >= 500
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try of a message that failed attempts times"""
+    return min(RETRY_MAX, RETRY_BASE * 2 ** max(0, attempts - 1))
+
+
+class SMTPPool:
+    """One SMTP connection, opened on first use, reused across batches and reopened if dropped"""
+
+    def __init__(self, host, port=587, user='', password='', starttls=False,
+                 timeout=SMTP_TIMEOUT, idle=SMTP_IDLE):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle = idle
+        self._smtp = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle:
+            self._close()
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.user:
+                    smtp.login(self.user, self.password)
+            except BaseException:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def send(self, message):
+        """Send an EmailMessage, reconnecting once if the server closed the connection"""
+        with self._lock:
+            try:
+                self._connection().send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self._close()
+                self._connection().send_message(message)
+            self._last_used = time.monotonic()
+
+    def close_idle(self):
+        """Close the connection if it has not been used for `idle` seconds"""
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle:
+                self._close()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (OSError, smtplib.SMTPException):
+            smtp.close()
+
+
+class MailQueue:
+    """Durable outbound mail: enqueue() stores a message, a background thread sends it"""
+
+    def __init__(self, store, pool=None, sender='', recipient=''):
+        self.store = store
+        self.pool = pool
+        self.sender = sender
+        self.recipient = recipient
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+        self._outages = 0       # consecutive batches the server could not be used for
+
+    def configured(self):
+        return self.pool is not None and bool(self.recipient)
+
+    def enqueue(self, subject, body, reply_to='', recipient=None):
+        """Queue a message and wake the sender; returns its id, or None if it could not be stored"""
+        mail_id = self.store.enqueue_mail(recipient or self.recipient, reply_to, subject, body)
+        if mail_id is not None:
+            self.start()
+            self._wake.set()
+        return mail_id
+
+    def _message(self, row):
+        _, recipient, reply_to, subject, body, _ = row
+        message = EmailMessage()
+        message['From'] = self.sender or self.recipient
+        message['To'] = recipient or self.recipient
+        if reply_to:
+            message['Reply-To'] = reply_to
+        message['Subject'] = subject
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid(domain=(self.sender or self.recipient).rpartition('@')[2] or None)
+        message.set_content(body)
+        return message
+
+    def _failed(self, row, error):
+        attempts = row[5] + 1
+        if _permanent(error) or attempts >= MAX_ATTEMPTS:
+            print(f"Giving up on mail {row[0]} after {attempts} attempt(s): {error}")
+            self.store.mail_failed(row[0], str(error))
+        else:
+            self.store.mail_failed(row[0], str(error), time.time() + retry_delay(attempts))
+
+    def _deferred(self, rows, error):
+        self._outages += 1
+        retry_at = time.time() + retry_delay(self._outages)
+        self.store.mail_deferred([row[0] for row in rows], str(error), retry_at)
+
+    def drain_once(self):
+        """Send one batch of due messages; returns (claimed, sent)"""
+        if not self.configured():
+            return 0, 0
+        rows = self.store.claim_mail(BATCH_SIZE, LEASE)
+        sent = []
+        for index, row in enumerate(rows):
+            try:
+                self.pool.send(self._message(row))
+            except (MESSAGE_ERRORS + (ValueError,)) as e:
+                if getattr(e, 'smtp_code', None) == 421:
+                    # "Service closing": the server hung up on us, not on the message
+                    print(f"Error sending mail: {e}")
+                    self.pool.close()
+                    self._deferred(rows[index:], e)
+                    break
+                print(f"Error sending mail {row[0]}: {e}")
+                self._failed(row, e)
+            except OSError as e:
+                # The server is unreachable or refusing us; the rest of the batch would fail alike
+                print(f"Error sending mail: {e}")
+                self.pool.close()
+                self._deferred(rows[index:], e)
+                break
+            else:
+                self._outages = 0
+                sent.append(row[0])
+        if sent:
+            self.store.mail_sent(sent)
+        return len(rows), len(sent)
+
+    def drain(self):
+        """Send everything that is due now; returns the number sent"""
+        total = 0
+        while True:
+            claimed, sent = self.drain_once()
+            total += sent
+            if claimed < BATCH_SIZE:
+                return total
+
+    def _prune(self):
+        now = time.time()
+        if now - self._pruned_at > 3600:
+            self._pruned_at = now
+            self.store.prune_mail(now - SENT_RETENTION)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                claimed, _ = self.drain_once()
+                self._prune()
+            except Exception as e:
+                print(f"Error draining mail queue: {e}")
+                claimed = 0
+            if claimed >= BATCH_SIZE:
+                continue
+            self.pool.close_idle()
+            self._wake.wait(POLL_INTERVAL)
+        self.pool.close()
+
+    def start(self):
+        """Start the sender thread in this process (threads do not survive a fork)"""
+        if not self.configured():
+            return False
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return True
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+        return True
+
+    def stop(self, timeout=SMTP_TIMEOUT):
+        """Ask the sender thread to finish its batch and wait for it"""
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+
+    def stats(self):
+        return self.store.mail_counts()
+
+
+def mail_queue_from_env(store):
+    """A MailQueue over store, configured from the MAIL_* environment variables"""
+    host = os.environ.get('MAIL_SMTP_HOST', '')
+    user = os.environ.get('MAIL_SMTP_USER', '')
+    pool = None
+    if host:
+        pool = SMTPPool(
+            host,
+            port=int(os.environ.get('MAIL_SMTP_PORT', 587)),
+            user=user,
+            password=os.environ.get('MAIL_SMTP_PASSWORD', ''),
+            # Never send credentials in the clear unless explicitly told to
+            starttls=_env_flag('MAIL_SMTP_STARTTLS', '1' if user else '0'),
+        )
+    recipient = os.environ.get('MAIL_TO', '')
+    return MailQueue(store, pool, sender=os.environ.get('MAIL_FROM', user or recipient), recipient=recipient)
+
+
+# Local stand-in SMTP server
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail from smtplib and print it"""
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('utf-8'))
+
+    def handle(self):
+        server = self.server
+        self._reply('220 localhost mail sink')
+        envelope = []
+        for raw in self.rfile:
+            command = raw.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self._reply('250-localhost')
+                self._reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self._reply('250 localhost')
+            elif verb in ('MAIL', 'RCPT'):
+                envelope.append(command)
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with server.lock:
+                    server.received += 1
+                    rejected = server.received <= server.reject
+                if rejected:
+                    self._reply('451 Try again later')
+                else:
+                    self._reply('250 OK queued')
+                    print(f"--- message {server.received} ({', '.join(envelope)})")
+                    print(b''.join(lines).decode('utf-8', 'replace'))
+                envelope = []
+            elif verb == 'RSET':
+                envelope = []
+                self._reply('250 OK')
+            elif verb == 'NOOP':
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def make_sink(port=1025, reject=0):
+    """A stand-in SMTP server on localhost (port 0 picks a free one); the first `reject` messages get a 451"""
+    server = _SinkServer(('127.0.0.1', port), _SinkHandler)
+    server.lock = threading.Lock()
+    server.received = 0
+    server.reject = reject
+    return server
+
+
+def run_sink(port=1025, reject=0):
+    """Serve make_sink() until interrupted"""
+    with make_sink(port, reject) as server:
+        print(f"📭 Mail sink listening on 127.0.0.1:{port} "
+              f"(MAIL_SMTP_HOST=127.0.0.1 MAIL_SMTP_PORT={port})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _option(args, name, default):
+    if name in args:
+        return int(args[args.index(name) + 1])
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0] if args else 'status'
+
+    if command == 'sink':
+        run_sink(port=_option(args, '--port', 1025), reject=_option(args, '--reject', 0))
+        return 0
+
+    from app import mail_queue
+
+    if command == 'status':
+        counts = mail_queue.stats()
+        for status in ('queued', 'sent', 'failed'):
+            print(f"{status:<7} {counts.get(status, 0)}")
+        if not mail_queue.configured():
+            print("\n⚠️  MAIL_SMTP_HOST and MAIL_TO are not both set; queued mail is not being sent")
+    elif command == 'drain':
+        if not mail_queue.configured():
+            print("❌ Set MAIL_SMTP_HOST and MAIL_TO to send mail")
+            return 1
+        sent = mail_queue.drain()
+        mail_queue.pool.close()
+        print(f"✅ Sent {sent} message(s)")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Request instrumentation for CassidyBlog
+
+Wrap expensive work in `metrics.stage('name')` to time it. Per-request stage
+timings can be sent back in a Server-Timing header (SERVER_TIMING=1), and are
+aggregated with request counts and latencies into histograms rendered in the
+Prometheus text format. With METRICS_ENABLED=0, stage() hands out a shared
+no-op context manager and no request hooks are installed.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+# Seconds; tuned for a blog where most work is well under a second
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{_labels(labels + [('le', repr(bound))])} {cumulative}"
+        yield f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {self.count}"
+        yield f"{name}_sum{_labels(labels)} {self.sum}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Stage timers, per-route request counters and cache statistics"""
+
+    def __init__(self, enabled=None, server_timing=None):
+        self.enabled = _env_flag('METRICS_ENABLED', '1') if enabled is None else enabled
+        self.server_timing = _env_flag('SERVER_TIMING', '0') if server_timing is None else server_timing
+        self._lock = threading.Lock()
+        self._stages = {}       # stage -> Histogram
+        self._requests = {}     # (endpoint, method, status) -> count
+        self._latency = {}      # endpoint -> Histogram
+        self._caches = {}       # name -> callable returning a stats() dict
+
+    def stage(self, name):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return _NOOP_STAGE
+        return _Stage(self, name)
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram()
+            histogram.observe(seconds)
+        if has_request_context():
+            timings = g.setdefault('stage_timings', [])
+            timings.append((name, seconds))
+
+    def register_cache(self, name, stats):
+        """Report a cache's hits/misses/evictions; stats() returns its counters"""
+        self._caches[name] = stats
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_request_timer():
+            g.request_start = time.perf_counter()
+
+        def template_started(sender, template, context, **extra):
+            g.template_start = time.perf_counter()
+
+        def template_finished(sender, template, context, **extra):
+            start = g.pop('template_start', None)
+            if start is not None:
+                self.record_stage('template', time.perf_counter() - start)
+
+        before_render_template.connect(template_started, app, weak=False)
+        template_rendered.connect(template_finished, app, weak=False)
+
+        @app.after_request
+        def record_request(response):
+            start = g.get('request_start')
+            if start is None:
+                return response
+            elapsed = time.perf_counter() - start
+            endpoint = request.endpoint or 'unmatched'
+            key = (endpoint, request.method, response.status_code)
+            with self._lock:
+                self._requests[key] = self._requests.get(key, 0) + 1
+                histogram = self._latency.get(endpoint)
+                if histogram is None:
+                    histogram = self._latency[endpoint] = Histogram()
+                histogram.observe(elapsed)
+            if self.server_timing:
+                parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in g.get('stage_timings', ())]
+                parts.append(f"total;dur={elapsed * 1000:.2f}")
+                response.headers['Server-Timing'] = ', '.join(parts)
+            return response
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted(self._latency.items())
+            stages = sorted(self._stages.items())
+
+            lines.append('# HELP blog_http_requests_total Requests served, by route and status.')
+            lines.append('# TYPE blog_http_requests_total counter')
+            for (endpoint, method, status), count in requests:
+                labels = [('endpoint', endpoint), ('method', method), ('status', status)]
+                lines.append(f"blog_http_requests_total{_labels(labels)} {count}")
+
+            lines.append('# HELP blog_http_request_duration_seconds Time spent handling requests, by route.')
+            lines.append('# TYPE blog_http_request_duration_seconds histogram')
+            for endpoint, histogram in latency:
+                lines.extend(histogram.lines('blog_http_request_duration_seconds', [('endpoint', endpoint)]))
+
+            lines.append('# HELP blog_stage_duration_seconds Time spent in each rendering stage.')
+            lines.append('# TYPE blog_stage_duration_seconds histogram')
+            for name, histogram in stages:
+                lines.extend(histogram.lines('blog_stage_duration_seconds', [('stage', name)]))
+
+        caches = sorted((name, stats()) for name, stats in self._caches.items())
+        for metric, kind, help_text in (
+            ('hits', 'counter', 'Cache lookups served from the cache.'),
+            ('misses', 'counter', 'Cache lookups that had to compute the value.'),
+            ('evictions', 'counter', 'Entries evicted to stay within the cache bound.'),
+            ('hit_ratio', 'gauge', 'Hits divided by lookups since start.'),
+            ('size', 'gauge', 'Entries currently held.'),
+        ):
+            name = f"blog_cache_{metric}" + ('_total' if kind == 'counter' else '')
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for cache, stats in caches:
+                if metric in stats:
+                    lines.append(f"{name}{_labels([('cache', cache)])} {stats[metric]}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,239 @@
+"""
+Post parsing and rendering for CassidyBlog
+
+Turns a markdown post file into its listing metadata (PostMeta) and its
+sanitized HTML. Build pool processes import only this module, never app.py,
+so starting one costs an interpreter plus markdown and bleach rather than
+Flask, the extensions and the app's indexes.
+"""
+
+import hashlib
+import os
+import re
+from datetime import datetime
+
+import bleach
+import markdown
+
+# Bleach allowlist for sanitizing rendered markdown
+ALLOWED_TAGS = [
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'p', 'br', 'hr',
+    'strong', 'em', 'b', 'i', 'u', 's', 'del',
+    'pre', 'code',
+    'ul', 'ol', 'li',
+    'blockquote',
+    'a',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+    'img',
+    'sup', 'sub',
+    'div', 'span',
+]
+
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title', 'rel'],
+    'img': ['src', 'alt', 'title'],
+    'code': ['class'],
+    'pre': ['class'],
+    'div': ['class'],
+    'span': ['class'],
+    'td': ['align'],
+    'th': ['align'],
+}
+
+MARKDOWN_EXTENSIONS = ['fenced_code']
+
+
+def _renderer_fingerprint():
+    # This module's source covers the allowlists and the rendering code
+    with open(__file__, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(source)
+    digest.update(f"{markdown.__version__}:{bleach.__version__}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Identifies the rules render_post_html() applies; stored HTML compiled under
+# different ones (an allowlist edit, a markdown or bleach upgrade) is stale
+RENDERER_FINGERPRINT = _renderer_fingerprint()
+
+
+class PostMeta:
+    """Listing metadata for one post; the body stays on disk until rendered"""
+
+    __slots__ = ('slug', 'title', 'date_obj', 'date_str', 'summary', 'path', 'mtime', 'size', 'sha')
+
+    def __init__(self, slug, title, date_obj, date_str, summary, path, mtime, size, sha):
+        self.slug = slug
+        self.title = title
+        self.date_obj = date_obj
+        self.date_str = date_str
+        self.summary = summary
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.sha = sha
+
+    @property
+    def timestamp(self):
+        return self.mtime  # Keep for compatibility
+
+    def __repr__(self):
+        return f"<PostMeta {self.slug!r}>"
+
+    def row(self):
+        """Column values for the shared post store"""
+        return (self.slug, self.title, self.date_obj.isoformat(), self.date_str,
+                self.summary, self.path, self.mtime, self.size, self.sha)
+
+    @classmethod
+    def from_row(cls, row):
+        slug, title, date, date_str, summary, path, mtime, size, sha = row
+        return cls(slug, title, datetime.fromisoformat(date), date_str, summary, path, mtime, size, sha)
+
+
+def parse_post_content(content, file_path):
+    """Parse markdown content and extract metadata"""
+    lines = content.split('\n')
+    if not lines:
+        return None
+    
+    # Extract title from first line
+    title = lines[0].replace('#', '').strip() if lines[0].startswith('#') else 'Untitled'
+    
+    # Get slug from filename
+    slug = os.path.basename(file_path).replace('.md', '')
+    
+    # Parse date from content or use predefined mapping
+    date_obj, date_str = extract_date_from_content(content, slug)
+    
+    # Create summary from content (skip title and potential date line)
+    summary = create_summary(lines)
+    
+    return {
+        'title': title,
+        'content': content,
+        'slug': slug,
+        'date_obj': date_obj,
+        'date_str': date_str,
+        'summary': summary,
+        'timestamp': os.path.getmtime(file_path)  # Keep for compatibility
+    }
+
+
+def extract_date_from_content(content, slug):
+    """Extract or assign publication date"""
+    # Manual date mapping for existing posts (newest first)
+    date_mapping = {
+        'nfl_sentiment_blog_post': ('2025-01-29', 'January 29, 2025'),  # Make this the newest
+        'healthcare_big_data_blog': ('2025-01-15', 'January 15, 2025'),
+        'insurance_data_mining_blog': ('2025-01-10', 'January 10, 2025'),
+        'banking_data_mining_blog': ('2025-01-05', 'January 5, 2025'),
+        'database_security_blog': ('2024-12-20', 'December 20, 2024'),
+        'dashboard_comparison_blog': ('2024-12-15', 'December 15, 2024'),
+        'doj_google_blog_post': ('2024-12-10', 'December 10, 2024'),
+    }
+    
+    if slug in date_mapping:
+        date_str, display_date = date_mapping[slug]
+        try:
+            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            return date_obj, display_date
+        except ValueError:
+            pass
+    
+    # Try to extract date from content using regex
+    date_pattern = r'\*([A-Za-z]+ \d{1,2}, \d{4})'
+    match = re.search(date_pattern, content)
+    if match:
+        try:
+            date_str = match.group(1)
+            date_obj = datetime.strptime(date_str, '%B %d, %Y')
+            return date_obj, date_str
+        except ValueError:
+            pass
+    
+    # Fallback to file modification time
+    return datetime(2024, 1, 1), 'January 1, 2024'
+
+
+def create_summary(lines):
+    """Create a clean summary from content lines"""
+    # Skip title (line 0) and potential date/author line
+    start_idx = 1
+    if len(lines) > 1 and ('*' in lines[1] or lines[1].strip() == ''):
+        start_idx = 2
+    
+    # Find content lines (skip empty lines)
+    content_lines = []
+    for i in range(start_idx, min(len(lines), start_idx + 5)):
+        line = lines[i].strip()
+        if line and not line.startswith('#'):
+            content_lines.append(line)
+        if len(content_lines) >= 2:  # Get 2 substantial lines
+            break
+    
+    summary = ' '.join(content_lines)
+    # Clean up markdown formatting
+    summary = re.sub(r'[#*>]', '', summary)
+    summary = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', summary)  # Remove links
+    summary = summary.strip()
+    return summary[:200] + '...' if len(summary) > 200 else summary
+
+
+def markdown_to_html(content):
+    """Convert post markdown to (unsanitized) HTML, dropping the title heading"""
+    # Remove the first line (title) from markdown content to avoid duplication
+    content_lines = content.split('\n')
+    # Skip the first line if it's a heading (starts with #)
+    if content_lines and content_lines[0].startswith('#'):
+        content_without_title = '\n'.join(content_lines[1:])
+    else:
+        content_without_title = content
+    return markdown.markdown(content_without_title, extensions=MARKDOWN_EXTENSIONS)
+
+
+def sanitize_html(html_content):
+    """Strip everything outside the allowlists from rendered HTML"""
+    return bleach.clean(
+        html_content,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        strip=True,
+    )
+
+
+def render_post_html(content):
+    """Convert post markdown to sanitized HTML, dropping the title heading"""
+    return sanitize_html(markdown_to_html(content))
+
+
+def build_post(file, render=False):
+    """Parse one post file, and render it if asked; returns (file, PostMeta, html, error).
+
+    Runs in build pool processes, so failures come back as an error string
+    instead of being raised or printed.
+    """
+    try:
+        st = os.stat(file)
+        with open(file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        sha = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        post_data = parse_post_content(content, file)
+        if not post_data:
+            return file, None, None, None
+        html = render_post_html(content) if render else None
+    except Exception as e:
+        return file, None, None, str(e)
+    entry = PostMeta(
+        slug=post_data['slug'],
+        title=post_data['title'],
+        date_obj=post_data['date_obj'],
+        date_str=post_data['date_str'],
+        summary=post_data['summary'],
+        path=file,
+        mtime=st.st_mtime,
+        size=st.st_size,
+        sha=sha,
+    )
+    return file, entry, html, None
@@ -0,0 +1,435 @@
+"""
+SQLite-backed storage that sits alongside the markdown posts
+
+Posts stay as .md files under content/posts; this store keeps what is derived
+from them, in one database file every gunicorn worker opens (WAL mode, so
+readers never block on the writer):
+
+- compiled_post holds each post's rendered, sanitized HTML together with the
+  SHA-256 of the markdown it came from and a fingerprint of the renderer
+  (sanitizer allowlists, markdown and bleach versions), so a post is compiled
+  once at publish time and served from here until its source or the
+  sanitizing rules change.
+- post_meta holds the listing metadata of every post. The first process to
+  start parses the corpus and writes it; the rest load it instead of parsing
+  the files again. store_meta.posts_version is bumped on every change, so a
+  worker can tell with one cheap query that another worker published a post;
+  store_meta.posts_changed_at records when, which deletions need since they
+  leave no file mtime behind. <name>_index_version records which corpus
+  version the saved search and related-posts pickles hold, so only one worker
+  writes each change to them.
+- outbound_mail is the queue of mail waiting to be sent (see mail_queue.py).
+  A request appends a row and returns; a drainer claims due rows for a lease
+  period, so two workers draining at once never pick up the same message.
+"""
+
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; file_lock() is then a no-op
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS compiled_post (
+    slug TEXT PRIMARY KEY,
+    sha TEXT NOT NULL,
+    html TEXT NOT NULL,
+    compiled_at REAL NOT NULL,
+    renderer TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS post_meta (
+    slug TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    date TEXT NOT NULL,
+    date_str TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbound_mail (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    reply_to TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbound_mail_due ON outbound_mail (status, next_attempt);
+"""
+
+POST_COLUMNS = 'slug, title, date, date_str, summary, path, mtime, size, sha'
+MAIL_COLUMNS = 'id, recipient, reply_to, subject, body, attempts'
+
+
+# The process umask, read once at import: the only portable way to read it is
+# to set it, which must not happen while other threads may be creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(path, text):
+    """Write text to path so readers see either the old file or the new one, never half"""
+    directory = os.path.dirname(os.path.abspath(path))
+    # Dot-prefixed and not .md, so the post index never picks up the temp file
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        # mkstemp creates the file 0600; give it the mode a plain open() would
+        # (or the existing file's), so other users can still read the post
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path across processes for the duration of the block"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PostStore:
+    """Thread- and fork-safe access to the blog database; one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._inherited = []
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not cross a fork (gunicorn --preload), so reopen per process
+        if conn is None or self._local.pid != os.getpid():
+            if conn is not None:
+                # Closing a handle inherited across fork() can release the parent's
+                # locks or checkpoint the WAL under it, so keep it and never use it
+                self._inherited.append(conn)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection; the gunicorn master does so before forking workers"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+            self._local.conn = None
+
+    def _migrate(self, conn):
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(compiled_post)')}
+        if 'renderer' not in columns:
+            # Rows from before the renderer was recorded all count as stale
+            try:
+                conn.execute("ALTER TABLE compiled_post ADD COLUMN renderer TEXT NOT NULL DEFAULT ''")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # Compiled HTML
+
+    def get_compiled(self, slug, sha, renderer):
+        """Compiled HTML for slug if this renderer built it from content with this hash, else None"""
+        try:
+            row = self._conn().execute(
+                'SELECT html FROM compiled_post WHERE slug = ? AND sha = ? AND renderer = ?',
+                (slug, sha, renderer),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading compiled post {slug}: {e}")
+            return None
+        return row[0] if row else None
+
+    def put_compiled(self, slug, sha, html, renderer):
+        """Store (or replace) the compiled HTML for slug"""
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO compiled_post (slug, sha, html, compiled_at, renderer) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (slug, sha, html, time.time(), renderer),
+            )
+        except sqlite3.Error as e:
+            print(f"Error storing compiled post {slug}: {e}")
+            return False
+        return True
+
+    def prune_compiled(self, keep):
+        """Delete compiled posts whose slug is not in keep; returns how many went"""
+        try:
+            with self._transaction(immediate=True) as conn:
+                slugs = [row[0] for row in conn.execute('SELECT slug FROM compiled_post')]
+                stale = [slug for slug in slugs if slug not in keep]
+                conn.executemany('DELETE FROM compiled_post WHERE slug = ?', [(slug,) for slug in stale])
+        except sqlite3.Error as e:
+            print(f"Error pruning compiled posts: {e}")
+            return 0
+        return len(stale)
+
+    # Shared post metadata
+
+    def _version(self, conn, posts_dir):
+        rows = dict(conn.execute(
+            "SELECT key, value FROM store_meta WHERE key IN ('posts_dir', 'posts_version')"
+        ))
+        if rows.get('posts_dir') != posts_dir:
+            return 0
+        return int(rows.get('posts_version', 0))
+
+    def posts_version(self, posts_dir):
+        """Version stamp of the stored metadata for posts_dir (0 if none), or None on error"""
+        try:
+            return self._version(self._conn(), posts_dir)
+        except sqlite3.Error as e:
+            print(f"Error reading post store version: {e}")
+            return None
+
+    def posts_changed_at(self, posts_dir):
+        """Timestamp of the last change to the stored metadata for posts_dir, or None if unknown"""
+        try:
+            conn = self._conn()
+            if not self._version(conn, posts_dir):
+                return None
+            row = conn.execute("SELECT value FROM store_meta WHERE key = 'posts_changed_at'").fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading post store change time: {e}")
+            return None
+        return float(row[0]) if row else None
+
+    def load_posts(self, posts_dir, since=0):
+        """Return (version, rows changed after `since`, every stored slug), or None on error"""
+        try:
+            with self._transaction() as conn:
+                version = self._version(conn, posts_dir)
+                if version == 0:
+                    return 0, [], set()
+                rows = conn.execute(
+                    f'SELECT {POST_COLUMNS} FROM post_meta WHERE version > ?', (since,)
+                ).fetchall()
+                slugs = {row[0] for row in conn.execute('SELECT slug FROM post_meta')}
+            return version, rows, slugs
+        except sqlite3.Error as e:
+            print(f"Error loading post store: {e}")
+            return None
+
+    def load_or_build_posts(self, posts_dir, build):
+        """Return (version, rows, built) for posts_dir, calling build() if nothing is stored.
+
+        The build runs under the database write lock, so when several workers
+        start together only the first parses the corpus; the others wait for
+        it and then load its rows. Returns None if the store is unusable.
+        """
+        loaded = self.load_posts(posts_dir)
+        if loaded is None:
+            return None
+        if loaded[0]:
+            return loaded[0], loaded[1], False
+        try:
+            with self._transaction(immediate=True) as conn:
+                version = self._version(conn, posts_dir)
+                if version:
+                    rows = conn.execute(f'SELECT {POST_COLUMNS} FROM post_meta').fetchall()
+                    return version, rows, False
+                rows = build()
+                conn.execute('DELETE FROM post_meta')
+                conn.executemany(
+                    f'INSERT INTO post_meta ({POST_COLUMNS}, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)',
+                    rows,
+                )
+                conn.executemany(
+                    'INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)',
+                    [('posts_dir', posts_dir), ('posts_version', '1'), ('posts_changed_at', str(time.time()))],
+                )
+                return 1, rows, True
+        except sqlite3.Error as e:
+            print(f"Error building post store: {e}")
+            return None
+
+    def save_posts(self, posts_dir, upserts=(), deletes=()):
+        """Write changed rows and deletions, bumping the version; returns it (None on error)"""
+        if not upserts and not deletes:
+            return None
+        try:
+            with self._transaction(immediate=True) as conn:
+                version = self._version(conn, posts_dir)
+                if version == 0:
+                    # Never built for this directory; a later load will build it in full
+                    return None
+                version += 1
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO post_meta ({POST_COLUMNS}, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [tuple(row) + (version,) for row in upserts],
+                )
+                conn.executemany('DELETE FROM post_meta WHERE slug = ?', [(slug,) for slug in deletes])
+                conn.executemany(
+                    'INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)',
+                    [('posts_version', str(version)), ('posts_changed_at', str(time.time()))],
+                )
+            return version
+        except sqlite3.Error as e:
+            print(f"Error saving post store: {e}")
+            return None
+
+    # Derived indexes
+
+    def index_version(self, name):
+        """Corpus version the saved `name` index (search, related) was written at, or None"""
+        try:
+            row = self._conn().execute(
+                'SELECT value FROM store_meta WHERE key = ?', (f"{name}_index_version",)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading {name} index version: {e}")
+            return None
+        return row[0] if row else None
+
+    def set_index_version(self, name, version):
+        """Record the corpus version a just-saved index holds, so other workers skip saving it"""
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)',
+                (f"{name}_index_version", version),
+            )
+        except sqlite3.Error as e:
+            print(f"Error storing {name} index version: {e}")
+
+    # Outbound mail
+
+    def enqueue_mail(self, recipient, reply_to, subject, body):
+        """Append a message to the outbound queue; returns its id, or None on error"""
+        now = time.time()
+        try:
+            cursor = self._conn().execute(
+                'INSERT INTO outbound_mail (recipient, reply_to, subject, body, next_attempt, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (recipient, reply_to, subject, body, now, now),
+            )
+        except sqlite3.Error as e:
+            print(f"Error queueing mail: {e}")
+            return None
+        return cursor.lastrowid
+
+    def claim_mail(self, limit, lease):
+        """Claim up to limit due messages for lease seconds; returns their rows"""
+        now = time.time()
+        try:
+            with self._transaction(immediate=True) as conn:
+                rows = conn.execute(
+                    f"SELECT {MAIL_COLUMNS} FROM outbound_mail "
+                    "WHERE status = 'queued' AND next_attempt <= ? AND claimed_until <= ? "
+                    "ORDER BY next_attempt, id LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                conn.executemany(
+                    'UPDATE outbound_mail SET claimed_until = ? WHERE id = ?',
+                    [(now + lease, row[0]) for row in rows],
+                )
+        except sqlite3.Error as e:
+            print(f"Error claiming mail: {e}")
+            return []
+        return rows
+
+    def mail_sent(self, ids):
+        """Mark claimed messages as delivered"""
+        try:
+            self._conn().executemany(
+                "UPDATE outbound_mail SET status = 'sent', sent_at = ?, claimed_until = 0 WHERE id = ?",
+                [(time.time(), mail_id) for mail_id in ids],
+            )
+        except sqlite3.Error as e:
+            print(f"Error recording sent mail: {e}")
+
+    def mail_failed(self, mail_id, error, retry_at=None):
+        """Record a failed attempt; the message is retried at retry_at, or given up if None"""
+        try:
+            self._conn().execute(
+                'UPDATE outbound_mail SET status = ?, attempts = attempts + 1, next_attempt = ?, '
+                'claimed_until = 0, last_error = ? WHERE id = ?',
+                ('queued' if retry_at is not None else 'failed', retry_at or 0, error, mail_id),
+            )
+        except sqlite3.Error as e:
+            print(f"Error recording failed mail {mail_id}: {e}")
+
+    def mail_deferred(self, ids, error, retry_at):
+        """Put claimed messages back until retry_at without counting an attempt against them"""
+        try:
+            self._conn().executemany(
+                'UPDATE outbound_mail SET next_attempt = ?, claimed_until = 0, last_error = ? WHERE id = ?',
+                [(retry_at, error, mail_id) for mail_id in ids],
+            )
+        except sqlite3.Error as e:
+            print(f"Error deferring mail: {e}")
+
+    def mail_counts(self):
+        """Number of messages per status (queued, sent, failed)"""
+        try:
+            rows = self._conn().execute('SELECT status, COUNT(*) FROM outbound_mail GROUP BY status')
+            return dict(rows.fetchall())
+        except sqlite3.Error as e:
+            print(f"Error reading mail queue: {e}")
+            return {}
+
+    def prune_mail(self, before):
+        """Delete messages delivered before the given timestamp; returns how many went"""
+        try:
+            cursor = self._conn().execute(
+                "DELETE FROM outbound_mail WHERE status = 'sent' AND sent_at < ?", (before,)
+            )
+        except sqlite3.Error as e:
+            print(f"Error pruning mail queue: {e}")
+            return 0
+        return cursor.rowcount
@@ -0,0 +1,289 @@
+"""
+Related-post recommendations for CassidyBlog
+
+Each post is a sparse TF-IDF vector over its most significant terms (log term
+frequency times inverse document frequency, title terms boosted as in search,
+L2-normalised, so a dot product is the cosine similarity). Similarities are
+computed a whole row at a time, sparse-matrix style: a post's vector is
+multiplied against per-term "champion lists" (the posts weighting that term
+most), which bounds the work per post no matter how common its terms are.
+
+The top RELATED_POSTS neighbours of every post are precomputed into a table,
+so rendering a post is a dict lookup. When one post changes only its row, and
+the rows it appears in or now belongs in, are recomputed; other posts keep the
+IDF weights of the last full build until enough has changed that a rebuild is
+worth it. A caller on a latency path can sync with rebuild=False and run that
+rebuild elsewhere, then adopt() the result. The table is persisted with pickle
+(by default in instance/) like the search index.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import sys
+import threading
+from array import array
+
+from search import TITLE_WEIGHT, tokenize
+
+RELATED_POSTS = 4
+
+# Terms kept in each post's vector, and posts kept in each term's champion list
+VECTOR_TERMS = 24
+CHAMPIONS = 100
+
+# Fall back to a full rebuild once this share of the corpus changed incrementally
+REBUILD_RATIO = 0.1
+REBUILD_MIN_CHANGES = 16
+
+INDEX_FORMAT = 1
+
+
+class RelatedIndex:
+    """Precomputed top-k cosine neighbours of every post"""
+
+    def __init__(self, path=None, k=RELATED_POSTS):
+        self.path = path
+        self.k = k
+        self._docs = {}         # slug -> (sha, terms, term frequencies)
+        self._df = {}           # term -> number of posts containing it
+        self._vectors = {}      # slug -> ((term, weight), ...)
+        self._postings = {}     # term -> {slug: weight}, over the vectors only
+        self._champions = {}    # term -> [(weight, slug)] best first, rebuilt lazily
+        self._related = {}      # slug -> ((slug, score), ...) best first
+        self._drift = 0         # incremental changes since the last full build
+        self._rebuild_due = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def related(self, slug):
+        """The precomputed [(slug, score)] for a post, best first"""
+        return self._related.get(slug, ())
+
+    # Documents
+
+    def _set_doc(self, slug, title, content, sha):
+        counts = {}
+        for term in tokenize(content):
+            counts[term] = counts.get(term, 0) + 1
+        for term in tokenize(title):
+            counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+        self._drop_doc(slug)
+        terms = tuple(sys.intern(term) for term in counts)
+        self._docs[slug] = (sha, terms, array('I', counts.values()))
+        for term in terms:
+            self._df[term] = self._df.get(term, 0) + 1
+
+    def _drop_doc(self, slug):
+        doc = self._docs.pop(slug, None)
+        if doc is None:
+            return
+        for term in doc[1]:
+            df = self._df[term] - 1
+            if df:
+                self._df[term] = df
+            else:
+                del self._df[term]
+
+    # Vectors
+
+    def _vector(self, slug):
+        _, terms, tfs = self._docs[slug]
+        n = len(self._docs)
+        df = self._df
+        # A term no other post uses can't make two posts similar
+        weights = [
+            ((1 + math.log(tf)) * math.log(n / df[term]), term)
+            for term, tf in zip(terms, tfs) if df[term] > 1
+        ]
+        best = heapq.nlargest(VECTOR_TERMS, weights)
+        norm = math.sqrt(sum(weight * weight for weight, _ in best))
+        if not norm:
+            return ()
+        return tuple((term, weight / norm) for weight, term in best if weight > 0)
+
+    def _set_vector(self, slug, vector):
+        for term, _ in self._vectors.pop(slug, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(slug, None)
+                if not postings:
+                    del self._postings[term]
+            self._champions.pop(term, None)
+        if vector:
+            self._vectors[slug] = vector
+            for term, weight in vector:
+                self._postings.setdefault(term, {})[slug] = weight
+                self._champions.pop(term, None)
+
+    def _champion_list(self, term):
+        champions = self._champions.get(term)
+        if champions is None:
+            postings = self._postings.get(term, {})
+            champions = heapq.nlargest(CHAMPIONS, ((weight, slug) for slug, weight in postings.items()))
+            self._champions[term] = champions
+        return champions
+
+    def _scores(self, slug):
+        """Cosine similarity of slug against every post sharing a champion list with it"""
+        scores = {}
+        get = scores.get
+        for term, weight in self._vectors.get(slug, ()):
+            for other_weight, other in self._champion_list(term):
+                scores[other] = get(other, 0.0) + weight * other_weight
+        scores.pop(slug, None)
+        return scores
+
+    def _top(self, scores):
+        best = heapq.nlargest(self.k, scores.items(), key=lambda item: (item[1], item[0]))
+        return tuple((slug, score) for slug, score in best if score > 0)
+
+    # Builds
+
+    def rebuild(self):
+        """Recompute every vector and the whole table with current IDF weights"""
+        with self._lock:
+            self._postings = {}
+            self._champions = {}
+            self._vectors = {}
+            for slug in self._docs:
+                self._set_vector(slug, self._vector(slug))
+            self._related = {slug: self._top(self._scores(slug)) for slug in self._docs}
+            self._drift = 0
+            self._rebuild_due = False
+
+    def rebuild_due(self):
+        """Whether a sync(rebuild=False) skipped a full rebuild that is now wanted"""
+        return self._rebuild_due
+
+    def adopt(self, other):
+        """Take over another index's table, e.g. one rebuilt off to the side"""
+        with self._lock, other._lock:
+            self._docs = other._docs
+            self._df = other._df
+            self._vectors = other._vectors
+            self._postings = other._postings
+            self._champions = other._champions
+            self._related = other._related
+            self._drift = other._drift
+            self._rebuild_due = other._rebuild_due
+
+    def _relink(self, slug):
+        """Refresh slug's row and every row it appears in or now belongs in"""
+        scores = self._scores(slug)
+        self._related[slug] = self._top(scores)
+        for other, row in list(self._related.items()):
+            if other == slug:
+                continue
+            old = dict(row)
+            score = scores.get(other, 0.0)
+            if slug in old and score < old[slug]:
+                # It may have fallen below a post this row never kept; recompute
+                self._related[other] = self._top(self._scores(other))
+            elif score > 0 and (slug in old or len(row) < self.k or score > row[-1][1]):
+                old[slug] = score
+                self._related[other] = self._top(old)
+
+    def _unlink(self, slug):
+        self._set_vector(slug, ())
+        self._related.pop(slug, None)
+        for other, row in list(self._related.items()):
+            if any(related == slug for related, _ in row):
+                self._related[other] = self._top(self._scores(other))
+
+    def sync(self, entries, load_content, rebuild=True):
+        """Bring the table in line with {slug: sha}; returns the number of changes.
+
+        Only posts whose hash differs are re-read (via load_content(slug),
+        which returns (title, content) or None). A handful of changes are
+        applied incrementally; a first build, or enough accumulated drift in
+        the IDF weights, triggers a full rebuild. With rebuild=False that
+        rebuild is left to the caller (see rebuild_due()) and the table is
+        left as it is until then.
+        """
+        with self._lock:
+            removed = [slug for slug in self._docs if slug not in entries]
+            changed = [slug for slug, sha in entries.items()
+                       if self._docs.get(slug, (None,))[0] != sha]
+            if not removed and not changed:
+                return 0
+            full = (not self._related
+                    or self._drift + len(removed) + len(changed)
+                    > max(REBUILD_MIN_CHANGES, REBUILD_RATIO * len(entries)))
+            if full and not rebuild:
+                # Applying this many changes one by one costs as much as the
+                # rebuild itself; keep serving the current table until it lands
+                self._rebuild_due = True
+                return 0
+
+            for slug in removed:
+                self._drop_doc(slug)
+                if not full:
+                    self._unlink(slug)
+            updated = []
+            for slug in changed:
+                loaded = load_content(slug)
+                if loaded is None:
+                    continue
+                title, content = loaded
+                self._set_doc(slug, title, content, entries[slug])
+                updated.append(slug)
+
+            if full:
+                self.rebuild()
+            else:
+                for slug in updated:
+                    self._set_vector(slug, self._vector(slug))
+                for slug in updated:
+                    self._relink(slug)
+                self._drift += len(removed) + len(updated)
+            return len(removed) + len(updated)
+
+    # Persistence
+
+    def save(self, path=None):
+        """Write the table to disk atomically"""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            data = pickle.dumps(
+                {'format': INDEX_FORMAT, 'k': self.k, 'docs': self._docs, 'df': self._df,
+                 'vectors': self._vectors, 'related': self._related, 'drift': self._drift},
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Load a previously saved table; returns False if there is none usable"""
+        path = path or self.path
+        if not path:
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Error loading related posts {path}: {e}")
+            return False
+        if not isinstance(data, dict) or data.get('format') != INDEX_FORMAT or data.get('k') != self.k:
+            return False
+        with self._lock:
+            self._docs = data['docs']
+            self._df = data['df']
+            self._related = data['related']
+            self._drift = data['drift']
+            self._rebuild_due = False
+            self._vectors = {}
+            self._postings = {}
+            self._champions = {}
+            for slug, vector in data['vectors'].items():
+                self._set_vector(slug, vector)
+        return True
@@ -0,0 +1,296 @@
+"""
+Full-text search over blog posts
+
+An in-process inverted index (term -> {slug: term frequency}) over post titles
+and bodies, ranked with BM25. Posts are added, updated and removed one at a
+time, keyed by their content hash, so a changed post never rebuilds the whole
+index. The index is persisted with pickle (by default in instance/) so workers
+can load it on boot instead of re-tokenizing the corpus.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup, escape
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+
+STOPWORDS = frozenset("""
+a about an and are as at be but by can do for from has have how i if in into is
+it its of on or our so than that the their then there these they this to was we
+were what when which while who will with you your
+""".split())
+
+# Title terms count this many times towards a document's term frequency
+TITLE_WEIGHT = 3
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+INDEX_FORMAT = 1
+
+# Per-term score lists kept between queries (cleared whenever the index changes)
+IMPACT_CACHE_TERMS = 512
+
+# Multi-term queries touching at most this many postings are scored by plain
+# accumulation; longer lists use the threshold algorithm
+ACCUMULATE_POSTINGS = 4096
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords and single characters removed"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def plain_text(content):
+    """Strip the title line and common markdown syntax for display"""
+    lines = content.split('\n')
+    if lines and lines[0].startswith('#'):
+        lines = lines[1:]
+    text = '\n'.join(lines)
+    text = re.sub(r'```.*?```', ' ', text, flags=re.S)           # fenced code
+    text = re.sub(r'!?\[([^\]]*)\]\([^)]*\)', r'\1', text)       # links and images
+    text = re.sub(r'[#*_`>|]+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def snippet(content, terms, width=200):
+    """HTML-safe excerpt around the first matching term, with matches in <mark>"""
+    text = plain_text(content)
+    terms = set(terms)
+    start = 0
+    for match in WORD_RE.finditer(text):
+        if match.group().lower() in terms:
+            start = max(0, match.start() - width // 4)
+            break
+    end = min(len(text), start + width)
+    # Don't cut words in half at either edge
+    if start > 0:
+        space = text.find(' ', start)
+        start = space + 1 if 0 <= space < end else start
+    if end < len(text):
+        space = text.rfind(' ', start, end)
+        end = space if space > start else end
+    excerpt = text[start:end]
+
+    parts = []
+    last = 0
+    for match in WORD_RE.finditer(excerpt):
+        if match.group().lower() in terms:
+            parts.append(escape(excerpt[last:match.start()]))
+            parts.append(Markup('<mark>%s</mark>') % match.group())
+            last = match.end()
+    parts.append(escape(excerpt[last:]))
+    prefix = '… ' if start > 0 else ''
+    suffix = ' …' if end < len(text) else ''
+    return Markup(prefix) + Markup('').join(parts) + Markup(suffix)
+
+
+class SearchIndex:
+    """Incrementally maintained BM25 inverted index over posts"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._postings = {}     # term -> {slug: tf}
+        self._docs = {}         # slug -> (sha, title, length, terms)
+        self._total_len = 0
+        self._norms = None      # slug -> BM25 length normalisation, rebuilt lazily
+        self._impacts = OrderedDict()   # term -> ({slug: score}, [(slug, score)] best first)
+        self._lock = threading.RLock()
+        # Held by whatever changes the postings, and by save() while it pickles
+        # them, so a save never holds up searches (which only take _lock)
+        self._write_lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, slug, title, content, sha):
+        """Index (or re-index) one post"""
+        counts = {}
+        for term in tokenize(content):
+            counts[term] = counts.get(term, 0) + 1
+        for term in tokenize(title):
+            counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+        length = sum(counts.values())
+
+        with self._write_lock, self._lock:
+            self._remove(slug)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[slug] = tf
+            self._docs[slug] = (sha, title, length, tuple(counts))
+            self._total_len += length
+            self._invalidate()
+
+    def remove(self, slug):
+        """Drop one post from the index"""
+        with self._write_lock, self._lock:
+            self._remove(slug)
+
+    def _remove(self, slug):
+        doc = self._docs.pop(slug, None)
+        if doc is None:
+            return
+        for term in doc[3]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(slug, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= doc[2]
+        self._invalidate()
+
+    def _invalidate(self):
+        self._norms = None
+        self._impacts.clear()
+
+    def sync(self, entries, load_content):
+        """Bring the index in line with {slug: sha}; returns the number of changes.
+
+        Only posts whose hash differs are re-read (via load_content(slug),
+        which returns (title, content) or None) and re-tokenized.
+        """
+        changes = 0
+        with self._write_lock:
+            with self._lock:
+                stale = [slug for slug in self._docs if slug not in entries]
+                for slug in stale:
+                    self._remove(slug)
+                    changes += 1
+                current = {slug: doc[0] for slug, doc in self._docs.items()}
+            for slug, sha in entries.items():
+                if current.get(slug) == sha:
+                    continue
+                loaded = load_content(slug)
+                if loaded is None:
+                    continue
+                title, content = loaded
+                self.add(slug, title, content, sha)
+                changes += 1
+        return changes
+
+    def _get_norms(self):
+        norms = self._norms
+        if norms is None:
+            avgdl = self._total_len / len(self._docs) if self._docs else 1.0
+            norms = {
+                slug: K1 * (1 - B + B * doc[2] / avgdl)
+                for slug, doc in self._docs.items()
+            }
+            self._norms = norms
+        return norms
+
+    def _term_impacts(self, term):
+        """BM25 contribution of term to every document containing it, cached"""
+        impacts = self._impacts.get(term)
+        if impacts is not None:
+            self._impacts.move_to_end(term)
+            return impacts
+        postings = self._postings.get(term)
+        if not postings:
+            return None
+        n = len(self._docs)
+        df = len(postings)
+        weight = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (K1 + 1)
+        norms = self._get_norms()
+        scores = {slug: weight * tf / (tf + norms[slug]) for slug, tf in postings.items()}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        impacts = self._impacts[term] = (scores, ranked)
+        while len(self._impacts) > IMPACT_CACHE_TERMS:
+            self._impacts.popitem(last=False)
+        return impacts
+
+    def search(self, query, limit=10):
+        """Return [(slug, title, score)] for the best BM25 matches, best first.
+
+        Per-term scores are cached sorted best first, so a single term is a
+        slice and long multi-term queries use the threshold algorithm: walk the
+        lists in parallel and stop once no unseen document can beat the
+        current top `limit`.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+        with self._lock:
+            lists = [impacts for impacts in map(self._term_impacts, terms) if impacts]
+            if not lists:
+                return []
+            if len(lists) == 1:
+                best = lists[0][1][:limit]
+            elif sum(len(scores) for scores, _ in lists) <= ACCUMULATE_POSTINGS:
+                # Short lists: summing every posting is cheaper than walking them
+                totals = {}
+                for scores, _ in lists:
+                    get = totals.get
+                    for slug, score in scores.items():
+                        totals[slug] = get(slug, 0.0) + score
+                best = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1], item[0]))
+            else:
+                best = self._threshold_top(lists, limit)
+            return [(slug, self._docs[slug][1], score) for slug, score in best]
+
+    @staticmethod
+    def _threshold_top(lists, limit):
+        heap = []
+        seen = set()
+        for depth in range(max(len(ranked) for _, ranked in lists)):
+            threshold = 0.0
+            for _, ranked in lists:
+                if depth >= len(ranked):
+                    continue
+                slug, score = ranked[depth]
+                threshold += score
+                if slug in seen:
+                    continue
+                seen.add(slug)
+                total = sum(scores.get(slug, 0.0) for scores, _ in lists)
+                if len(heap) < limit:
+                    heapq.heappush(heap, (total, slug))
+                elif (total, slug) > heap[0]:
+                    heapq.heapreplace(heap, (total, slug))
+            if len(heap) == limit and heap[0][0] >= threshold:
+                break
+        return [(slug, score) for score, slug in sorted(heap, reverse=True)]
+
+    def save(self, path=None):
+        """Write the index to disk atomically"""
+        path = path or self.path
+        if not path:
+            return
+        with self._write_lock:
+            data = pickle.dumps(
+                {'format': INDEX_FORMAT, 'postings': self._postings, 'docs': self._docs},
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Load a previously saved index; returns False if there is none usable"""
+        path = path or self.path
+        if not path:
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Error loading search index {path}: {e}")
+            return False
+        if not isinstance(data, dict) or data.get('format') != INDEX_FORMAT:
+            return False
+        with self._write_lock, self._lock:
+            self._postings = data['postings']
+            self._docs = data['docs']
+            self._total_len = sum(doc[2] for doc in self._docs.values())
+            self._norms = None
+        return True
@@ -0,0 +1,151 @@
+"""Retry and give-up rules of the outbound mail queue"""
+
+import smtplib
+import threading
+import time
+
+import pytest
+
+import mail_queue
+from mail_queue import MailQueue, SMTPPool, make_sink
+from post_store import PostStore
+
+
+class FakePool:
+    """Stands in for SMTPPool; raises the queued errors in order, then accepts"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, message):
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        self.sent.append(message['Subject'])
+
+    def close(self):
+        pass
+
+    def close_idle(self):
+        pass
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PostStore(str(tmp_path / 'blog.db'))
+
+
+def make_queue(store, pool, messages=3):
+    for number in range(messages):
+        store.enqueue_mail('', 'visitor@example.org', f"message {number}", 'Hello')
+    return MailQueue(store, pool, sender='blog@example.com', recipient='owner@example.com')
+
+
+def rows(store):
+    return store._conn().execute(
+        'SELECT subject, status, attempts, next_attempt, last_error FROM outbound_mail ORDER BY id'
+    ).fetchall()
+
+
+@pytest.mark.parametrize('error', [
+    smtplib.SMTPAuthenticationError(535, b'5.7.8 Authentication credentials invalid'),
+    smtplib.SMTPConnectError(554, b'No SMTP service here'),
+    smtplib.SMTPServerDisconnected('Connection unexpectedly closed'),
+    ConnectionRefusedError(111, 'Connection refused'),
+    smtplib.SMTPSenderRefused(421, b'Service closing', 'blog@example.com'),
+])
+def test_connection_failure_defers_batch_without_counting_attempts(store, error):
+    queue = make_queue(store, FakePool(error))
+    before = time.time()
+
+    assert queue.drain_once() == (3, 0)
+
+    for _, status, attempts, next_attempt, last_error in rows(store):
+        assert status == 'queued'
+        assert attempts == 0
+        assert next_attempt > before
+        assert last_error
+    # Backed off: nothing is due until the retry time
+    assert queue.drain_once() == (0, 0)
+
+
+def test_repeated_outages_back_off_further(store, monkeypatch):
+    monkeypatch.setattr(mail_queue, 'RETRY_BASE', 10)
+    error = smtplib.SMTPAuthenticationError(535, b'bad credentials')
+    queue = make_queue(store, FakePool(error, error), messages=1)
+
+    queue.drain_once()
+    first = rows(store)[0][3] - time.time()
+    store._conn().execute('UPDATE outbound_mail SET next_attempt = 0')
+    queue.drain_once()
+    second = rows(store)[0][3] - time.time()
+
+    assert 9 < first < 11
+    assert 19 < second < 21
+    assert rows(store)[0][2] == 0
+
+
+def test_permanent_rejection_gives_up_on_that_message_only(store):
+    refused = smtplib.SMTPRecipientsRefused({'owner@example.com': (550, b'No such user')})
+    queue = make_queue(store, FakePool(refused))
+
+    assert queue.drain_once() == (3, 2)
+
+    assert [(subject, status) for subject, status, *_ in rows(store)] == [
+        ('message 0', 'failed'), ('message 1', 'sent'), ('message 2', 'sent'),
+    ]
+    assert store.mail_counts() == {'failed': 1, 'sent': 2}
+
+
+def test_permanent_data_rejection_gives_up(store):
+    queue = make_queue(store, FakePool(smtplib.SMTPDataError(554, b'Message rejected')), messages=1)
+
+    queue.drain_once()
+
+    assert rows(store)[0][1:3] == ('failed', 1)
+
+
+def test_temporary_rejection_retries_with_backoff(store, monkeypatch):
+    monkeypatch.setattr(mail_queue, 'RETRY_BASE', 30)
+    queue = make_queue(store, FakePool(smtplib.SMTPDataError(451, b'Try again later')), messages=1)
+    before = time.time()
+
+    queue.drain_once()
+
+    _, status, attempts, next_attempt, _ = rows(store)[0]
+    assert (status, attempts) == ('queued', 1)
+    assert before + 29 < next_attempt < time.time() + 31
+
+
+def test_gives_up_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(mail_queue, 'RETRY_BASE', 0)
+    monkeypatch.setattr(mail_queue, 'MAX_ATTEMPTS', 2)
+    busy = smtplib.SMTPDataError(451, b'Try again later')
+    queue = make_queue(store, FakePool(busy, busy), messages=1)
+
+    queue.drain_once()
+    assert rows(store)[0][1:3] == ('queued', 1)
+    queue.drain_once()
+    assert rows(store)[0][1:3] == ('failed', 2)
+
+
+def test_delivers_through_stand_in_server_after_a_retry(store, monkeypatch):
+    monkeypatch.setattr(mail_queue, 'RETRY_BASE', 0)
+    server = make_sink(port=0, reject=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        pool = SMTPPool('127.0.0.1', server.server_address[1], timeout=5)
+        queue = make_queue(store, pool, messages=2)
+
+        assert queue.drain_once() == (2, 1)
+        assert queue.drain_once() == (1, 1)
+        pool.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert store.mail_counts() == {'sent': 2}
+    assert server.received == 3